@@ -0,0 +1,220 @@
+import asyncio
+import math
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Optional
+
+import orjson
+
+from config import settings
+from metrics import registry
+
+# Never queued or shed: probes and scrapes must answer while the app is overloaded
+EXEMPT_PATHS = frozenset({"/healthz", "/readyz", "/metrics"})
+
+
+@dataclass(frozen=True)
+class RouteClass:
+    name: str
+    # Lower is more important; overload on a class also shrinks every less important one
+    priority: int
+    # Service time above which the class counts as overloaded, seconds
+    target_latency: float
+    initial_limit: int
+    min_limit: int
+    max_limit: int
+    max_queue: int
+    max_wait: float
+
+
+ROUTE_CLASSES = {
+    route_class.name: route_class
+    for route_class in (
+        # GET /user and other authenticated reads: one cached lookup
+        RouteClass("cheap", 0, 0.05, 200, 10, 1000, 200, 0.5),
+        # Profile writes and anything unclassified
+        RouteClass("default", 1, 0.25, 100, 5, 500, 100, 1.0),
+        # /auth/login and /auth/register: bcrypt
+        RouteClass("auth", 2, 0.5, 32, 2, 128, 32, 1.0),
+        # /admin: table scans and bulk imports
+        RouteClass("admin", 3, 1.0, 8, 1, 32, 8, 2.0),
+    )
+}
+
+
+def classify(method: str, path: str) -> RouteClass:
+    if path.startswith("/auth/"):
+        return ROUTE_CLASSES["auth"]
+    if path.startswith("/admin"):
+        return ROUTE_CLASSES["admin"]
+    if method in ("GET", "HEAD"):
+        return ROUTE_CLASSES["cheap"]
+    return ROUTE_CLASSES["default"]
+
+
+class AIMDLimiter:
+    """
+    Concurrency limit of one route class, adapted to its latency: +1/limit per request
+    served within ``target_latency`` while the limit is in use (so about +1 per
+    round), x ``backoff`` when one is slower, at most once per ``target_latency``.
+    Requests past the limit wait in FIFO order, up to ``max_queue`` of them and
+    ``max_wait`` seconds each; the rest are shed.
+
+    Only used from the event loop thread, so no locking.
+    """
+
+    def __init__(self, route_class: RouteClass, backoff: float = 0.9) -> None:
+        self.route_class = route_class
+        self.backoff = backoff
+        self.limit = float(route_class.initial_limit)
+        self.in_flight = 0
+        # Moving average of the time admitted requests spent queued, seconds
+        self.queue_delay = 0.0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._last_decrease = 0.0
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> Optional[str]:
+        """None once admitted, or why the request is shed (``queue_full`` or ``timeout``)."""
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            self._observe_queue_delay(0.0)
+            return None
+        if len(self._waiters) >= self.route_class.max_queue:
+            return "queue_full"
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.route_class.max_wait)
+        except asyncio.TimeoutError:
+            if not waiter.done():
+                self._waiters.remove(waiter)
+                waiter.cancel()
+                return "timeout"
+            # Admitted just as the wait ran out
+        except asyncio.CancelledError:
+            # The request went away while queued; give back the slot if it got one
+            if waiter.done():
+                self.in_flight -= 1
+                self._admit_waiters()
+            else:
+                self._waiters.remove(waiter)
+                waiter.cancel()
+            raise
+        self._observe_queue_delay(time.monotonic() - start)
+        return None
+
+    def release(self, latency: float) -> None:
+        self.in_flight -= 1
+        route_class = self.route_class
+        if latency > route_class.target_latency:
+            self.decrease()
+        elif self.in_flight + 1 >= self.limit - 1 or self._waiters:
+            self.limit = min(float(route_class.max_limit), self.limit + 1 / self.limit)
+        self._admit_waiters()
+
+    def decrease(self) -> None:
+        now = time.monotonic()
+        if now - self._last_decrease < self.route_class.target_latency:
+            return
+        self._last_decrease = now
+        self.limit = max(float(self.route_class.min_limit), self.limit * self.backoff)
+
+    def _admit_waiters(self) -> None:
+        while self._waiters and self.in_flight < self.limit:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def _observe_queue_delay(self, delay: float) -> None:
+        self.queue_delay += 0.1 * (delay - self.queue_delay)
+
+
+class AdmissionController:
+    """
+    One AIMDLimiter per route class (``classify``), so bcrypt-bound auth calls and admin
+    scans cannot pile up in front of cheap reads. When a class is over its target
+    latency, every lower-priority class backs off as well, which hands capacity to the
+    more important ones first.
+    """
+
+    def __init__(self) -> None:
+        self.limiters: Dict[str, AIMDLimiter] = {name: AIMDLimiter(route_class) for name, route_class in ROUTE_CLASSES.items()}
+
+    def limiter(self, method: str, path: str) -> AIMDLimiter:
+        return self.limiters[classify(method, path).name]
+
+    def release(self, limiter: AIMDLimiter, latency: float) -> None:
+        limiter.release(latency)
+        route_class = limiter.route_class
+        if latency > route_class.target_latency:
+            for other in self.limiters.values():
+                if other.route_class.priority > route_class.priority:
+                    other.decrease()
+
+    def gauges(self) -> Dict[str, float]:
+        gauges = {}
+        for name, limiter in self.limiters.items():
+            labels = f'{{route_class="{name}"}}'
+            gauges[f"admission_limit{labels}"] = round(limiter.limit, 2)
+            gauges[f"admission_in_flight{labels}"] = limiter.in_flight
+            gauges[f"admission_queued{labels}"] = limiter.queued
+            gauges[f"admission_queue_delay_seconds{labels}"] = round(limiter.queue_delay, 4)
+        return gauges
+
+
+admission = AdmissionController()
+
+
+class AdmissionMiddleware:
+    """
+    Pure ASGI middleware: admits each request through its route class's limiter, or
+    sheds it at once with 503 and Retry-After when the class's queue is full or the
+    wait runs out, instead of letting it time out in the server's queue.
+
+    Checks settings.ADMISSION_ENABLED per request, so it can be switched off at runtime.
+    """
+
+    def __init__(self, app, controller: AdmissionController) -> None:
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.ADMISSION_ENABLED or scope["path"] in EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        limiter = self.controller.limiter(scope["method"], scope["path"])
+        reason = await limiter.acquire()
+        if reason is not None:
+            registry.inc("admission_shed_total", route_class=limiter.route_class.name, reason=reason)
+            await self._shed(send, limiter.route_class)
+            return
+
+        start = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(limiter, time.monotonic() - start)
+
+    @staticmethod
+    async def _shed(send, route_class: RouteClass) -> None:
+        body = orjson.dumps({"detail": "The server is overloaded, please retry later."})
+        retry_after = str(max(1, math.ceil(route_class.max_wait)))
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", retry_after.encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
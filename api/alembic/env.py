@@ -1,3 +1,4 @@
+import time
 from logging.config import fileConfig
 
 from sqlalchemy import engine_from_config
@@ -18,7 +19,7 @@ fileConfig(config.config_file_name)
 # from myapp import mymodel
 # target_metadata = mymodel.Base.metadata
 from database.db import Base
-from models.user import User
+from models import AuditLog, User
 target_metadata = Base.metadata
 
 # other values from the config, defined by the needs of env.py,
@@ -26,7 +27,11 @@ target_metadata = Base.metadata
 # my_important_option = config.get_main_option("my_important_option")
 # ... etc.
 from config import settings
-from sqlalchemy import engine_from_config, pool
+from sqlalchemy import engine_from_config, pool, text
+
+# pg_advisory_lock key: replicas starting together run the migrations one at a time
+MIGRATIONS_LOCK_ID = 720150917
+MIGRATIONS_LOCK_POLL_SECONDS = 1.0
 
 config.set_main_option(
     "sqlalchemy.url",
@@ -57,6 +62,23 @@ def run_migrations_offline():
         context.run_migrations()
 
 
+def _acquire_migrations_lock(connection):
+    """
+    Poll instead of blocking in pg_advisory_lock: a waiting replica would keep its
+    transaction (and snapshot) open, and CREATE INDEX CONCURRENTLY in the holder's
+    migrations waits for every older snapshot, so the two would deadlock. Each attempt
+    is committed, so nothing is held open between them.
+    """
+    while True:
+        acquired = connection.execute(
+            text("SELECT pg_try_advisory_lock(:id)"), {"id": MIGRATIONS_LOCK_ID}
+        ).scalar_one()
+        connection.commit()
+        if acquired:
+            return
+        time.sleep(MIGRATIONS_LOCK_POLL_SECONDS)
+
+
 def run_migrations_online():
     """Run migrations in 'online' mode.
 
@@ -71,12 +93,19 @@ def run_migrations_online():
     )
 
     with connectable.connect() as connection:
-        context.configure(
-            connection=connection, target_metadata=target_metadata
-        )
-
-        with context.begin_transaction():
-            context.run_migrations()
+        # Session-level lock: held across the migration transactions, released below
+        # (or when the connection closes if a migration fails)
+        _acquire_migrations_lock(connection)
+        try:
+            context.configure(
+                connection=connection, target_metadata=target_metadata
+            )
+
+            with context.begin_transaction():
+                context.run_migrations()
+        finally:
+            connection.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATIONS_LOCK_ID})
+            connection.commit()
 
 
 if context.is_offline_mode():
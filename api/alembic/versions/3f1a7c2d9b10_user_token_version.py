@@ -0,0 +1,24 @@
+"""user token version
+
+Revision ID: 3f1a7c2d9b10
+Revises: 9ccfccb802c3
+Create Date: 2026-10-18 10:12:41.208113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1a7c2d9b10'
+down_revision = '9ccfccb802c3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('users', sa.Column('token_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    op.drop_column('users', 'token_version')
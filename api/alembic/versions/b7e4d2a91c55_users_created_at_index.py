@@ -0,0 +1,24 @@
+"""users created_at index
+
+Revision ID: b7e4d2a91c55
+Revises: 3f1a7c2d9b10
+Create Date: 2026-10-18 11:03:17.552910
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e4d2a91c55'
+down_revision = '3f1a7c2d9b10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_users_created_at_id', 'users', ['created_at', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_users_created_at_id', table_name='users')
@@ -0,0 +1,24 @@
+"""users updated_at index
+
+Revision ID: d51c8e3f0a27
+Revises: b7e4d2a91c55
+Create Date: 2026-10-18 14:31:40.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd51c8e3f0a27'
+down_revision = 'b7e4d2a91c55'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_users_updated_at', 'users', ['updated_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_users_updated_at', table_name='users')
@@ -0,0 +1,40 @@
+"""audit log
+
+Revision ID: e2a94b6c1f38
+Revises: d51c8e3f0a27
+Create Date: 2026-10-18 16:12:05.374921
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2a94b6c1f38'
+down_revision = 'd51c8e3f0a27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('audit_log',
+    sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), autoincrement=True, nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('actor', sa.String(), nullable=True),
+    sa.Column('action', sa.String(length=16), nullable=False),
+    sa.Column('entity', sa.String(), nullable=False),
+    sa.Column('entity_id', sa.String(), nullable=True),
+    sa.Column('old_values', sa.JSON().with_variant(postgresql.JSONB(astext_type=sa.Text()), 'postgresql'), nullable=True),
+    sa.Column('new_values', sa.JSON().with_variant(postgresql.JSONB(astext_type=sa.Text()), 'postgresql'), nullable=True),
+    sa.Column('request_id', sa.String(length=128), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_audit_log_created_at', 'audit_log', ['created_at'], unique=False)
+    op.create_index('ix_audit_log_entity', 'audit_log', ['entity', 'entity_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_audit_log_entity', table_name='audit_log')
+    op.drop_index('ix_audit_log_created_at', table_name='audit_log')
+    op.drop_table('audit_log')
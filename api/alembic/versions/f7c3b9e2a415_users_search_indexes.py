@@ -0,0 +1,48 @@
+"""users search indexes
+
+Revision ID: f7c3b9e2a415
+Revises: e2a94b6c1f38
+Create Date: 2026-10-18 18:02:11.640153
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f7c3b9e2a415'
+down_revision = 'e2a94b6c1f38'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = (
+    # name, expression, unique, method
+    ('ux_users_lower_email', 'lower(email)', True, None),
+    ('ix_users_lower_username_prefix', '(lower(username) COLLATE "C")', False, None),
+    ('ix_users_lower_email_prefix', '(lower(email) COLLATE "C")', False, None),
+    ('ix_users_lower_username_trgm', 'lower(username) gin_trgm_ops', False, 'gin'),
+    ('ix_users_lower_email_trgm', 'lower(email) gin_trgm_ops', False, 'gin'),
+)
+
+
+def upgrade():
+    # CONCURRENTLY cannot run inside a transaction, and keeps users writable while the
+    # indexes build. ux_users_lower_email fails if two emails differ only in case;
+    # merge those first. A failed concurrent build leaves an INVALID index behind, so
+    # each one is dropped before it is built and a rerun starts clean.
+    with op.get_context().autocommit_block():
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for name, expression, unique, method in INDEXES:
+            op.drop_index(name, table_name='users', postgresql_concurrently=True, if_exists=True)
+            op.create_index(
+                name, 'users', [sa.text(expression)],
+                unique=unique, postgresql_using=method, postgresql_concurrently=True,
+            )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, _, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name='users', postgresql_concurrently=True, if_exists=True)
+    # pg_trgm is left installed: other schemas in the database may use it
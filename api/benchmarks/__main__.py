@@ -0,0 +1,121 @@
+"""
+Benchmark suite.
+
+    python -m benchmarks [micro|load|all] [--database-url URL]
+                         [--save-baseline] [--baseline benchmarks/baseline.json]
+                         [--profile-queries report.json]
+
+Runs in process against the ASGI app (no uvicorn, no network) and a local database:
+the DB_* settings by default, or ``--database-url`` for a throwaway Postgres. With
+``--database-url sqlite:///...`` the schema is created on the fly, which is enough for
+everything except the Postgres-only code paths. Exits with status 1 when a result
+regresses past ``--tolerance`` relative to the saved baseline.
+
+``--profile-queries`` runs the suites with the query profiler on (threshold
+DB_PROFILER_SLOW_MS), samples EXPLAIN for the slowest fingerprints and dumps the
+report as JSON (``-`` for stdout).
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+from benchmarks.common import compare_with_baseline, print_results, save_baseline
+from database.session import db_engine
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    parser.add_argument("suite", nargs="?", choices=("micro", "load", "all"), default="all")
+    parser.add_argument("--database-url", help="Run against this database instead of the DB_* settings.")
+    parser.add_argument("--iterations", type=int, default=1000, help="Micro-benchmark iterations.")
+    parser.add_argument("--requests", type=int, default=500, help="Requests per load scenario.")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--admin-rows", type=int, default=100_000, help="Users in the table for /admin/users.")
+    parser.add_argument("--keep-data", action="store_true", help="Keep the seeded users for the next run.")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression (0.2 = 20%%).")
+    parser.add_argument("--profile-queries", metavar="PATH", help="Dump the slow query report here ('-' for stdout).")
+    return parser.parse_args()
+
+
+def configure_database(url: str) -> None:
+    async_url = url
+    if url.startswith("postgresql://"):
+        async_url = url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    elif url.startswith("sqlite://"):
+        async_url = url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    db_engine.configure(url, async_url)
+
+    if url.startswith("sqlite"):
+        from sqlalchemy import create_engine
+        from database.db import Base
+        import models  # noqa: F401  registers the tables
+
+        Base.metadata.create_all(create_engine(url))
+
+
+async def run(args) -> dict:
+    from main import app
+    from benchmarks import load, micro
+    from database.profiler import query_profiler
+
+    results = []
+    async with app.router.lifespan_context(app):
+        if args.profile_queries:
+            query_profiler.enable()
+        if args.suite in ("micro", "all"):
+            results += await micro.run(args.iterations)
+        if args.suite in ("load", "all"):
+            results += await load.run(app, args.requests, args.concurrency, args.admin_rows, args.keep_data)
+        if args.profile_queries:
+            query_profiler.disable()
+            await query_profiler.sample_plans()
+            dump_query_report(args.profile_queries, query_profiler.report())
+    return {result.name: result.summary() for result in results}
+
+
+def dump_query_report(path: str, report: dict) -> None:
+    rendered = json.dumps(report, indent=2, default=str)
+    if path == "-":
+        print(rendered)
+        return
+    with open(path, "w") as f:
+        f.write(rendered + "\n")
+    print(f"Slow query report ({report['fingerprints']} fingerprints) saved to {path}")
+
+
+def main() -> int:
+    args = parse_args()
+    if args.database_url:
+        configure_database(args.database_url)
+
+    results = asyncio.run(run(args))
+    print_results(results)
+
+    if args.save_baseline:
+        save_baseline(args.baseline, results)
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to create one.")
+        return 0
+
+    regressions = compare_with_baseline(results, args.baseline, args.tolerance)
+    if regressions:
+        print(f"\nREGRESSIONS against {args.baseline}:", file=sys.stderr)
+        for regression in regressions:
+            print(f"  - {regression}", file=sys.stderr)
+        return 1
+
+    print(f"\nNo regressions against {args.baseline} (tolerance {args.tolerance:.0%}).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+import asyncio
+import json
+import math
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from database.session import db_engine
+from metrics import registry
+
+
+@dataclass
+class BenchResult:
+    name: str
+    latencies: List[float] = field(default_factory=list)
+    wall_time: float = 0.0
+    db_queries_per_request: Optional[float] = None
+
+    def summary(self) -> Dict[str, float]:
+        values = sorted(self.latencies)
+        summary = {
+            "n": len(values),
+            "p50_ms": round(percentile(values, 50) * 1000, 3),
+            "p95_ms": round(percentile(values, 95) * 1000, 3),
+            "p99_ms": round(percentile(values, 99) * 1000, 3),
+            "rps": round(len(values) / self.wall_time, 1) if self.wall_time else 0.0,
+        }
+        if self.db_queries_per_request is not None:
+            summary["db_queries_per_request"] = round(self.db_queries_per_request, 2)
+        return summary
+
+
+def open_session():
+    return db_engine.async_session() if db_engine.async_mode else db_engine.session()
+
+
+async def close_session(db) -> None:
+    if db_engine.async_mode:
+        await db.close()
+    else:
+        db.close()
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    # Nearest-rank
+    index = max(0, math.ceil(q / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+async def measure(
+    name: str,
+    call: Callable[[int], Awaitable[object]],
+    iterations: int,
+    concurrency: int = 1,
+    route: Optional[str] = None,
+) -> BenchResult:
+    """
+    Run ``call(i)`` ``iterations`` times with up to ``concurrency`` in flight. With
+    ``route`` (``"METHOD /path"``) the DB queries per request are taken from the
+    metrics middleware's counters for that route.
+    """
+    result = BenchResult(name)
+    queue = iter(range(iterations))
+    before = _route_queries(route)
+
+    async def worker():
+        for i in queue:
+            start = time.perf_counter()
+            await call(i)
+            result.latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    result.wall_time = time.perf_counter() - start
+
+    if route is not None:
+        after = _route_queries(route)
+        requests = after[1] - before[1]
+        result.db_queries_per_request = (after[0] - before[0]) / requests if requests else 0.0
+    return result
+
+
+def _route_queries(route: Optional[str]):
+    if route is None:
+        return 0.0, 0
+    method, path = route.split(" ", 1)
+    histogram = registry.db_queries.get((method, path))
+    return (histogram.sum, histogram.count) if histogram else (0.0, 0)
+
+
+def print_results(results: Dict[str, Dict[str, float]]) -> None:
+    header = f"{'benchmark':<40}{'n':>7}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}{'rps':>10}{'q/req':>8}"
+    print(header)
+    print("-" * len(header))
+    for name, s in results.items():
+        queries = s.get("db_queries_per_request")
+        print(
+            f"{name:<40}{s['n']:>7}{s['p50_ms']:>11}{s['p95_ms']:>11}{s['p99_ms']:>11}{s['rps']:>10}"
+            f"{'' if queries is None else queries:>8}"
+        )
+
+
+def save_baseline(path: str, results: Dict[str, Dict[str, float]]) -> None:
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+def compare_with_baseline(
+    results: Dict[str, Dict[str, float]], path: str, tolerance: float
+) -> List[str]:
+    """Regressions beyond ``tolerance`` (0.2 = 20%) in p95 latency, throughput or queries/request."""
+    with open(path) as f:
+        baseline = json.load(f)
+
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        if previous["p95_ms"] and current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['p95_ms']} ms -> {current['p95_ms']} ms")
+        if previous["rps"] and current["rps"] < previous["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {previous['rps']} -> {current['rps']} rps")
+        if current.get("db_queries_per_request", 0) > previous.get("db_queries_per_request", float("inf")):
+            regressions.append(
+                f"{name}: DB queries/request {previous['db_queries_per_request']} -> "
+                f"{current['db_queries_per_request']}"
+            )
+    return regressions
@@ -0,0 +1,59 @@
+"""
+Cold-start profile: what importing the app costs a fresh worker.
+
+    python -m benchmarks.import_time [--runs 5] [--top 25] [--module main]
+
+Runs ``python -X importtime -c "import main"`` in fresh interpreters and prints the
+median total and the modules with the largest cumulative import time.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def profile_once(module: str) -> Dict[str, Tuple[int, int]]:
+    """``{module: (self_us, cumulative_us)}`` for one fresh interpreter."""
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=API_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.import_time")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--module", default="main")
+    args = parser.parse_args()
+
+    runs = [profile_once(args.module) for _ in range(args.runs)]
+    cumulative: Dict[str, List[int]] = {}
+    for times in runs:
+        for name, (_, total) in times.items():
+            cumulative.setdefault(name, []).append(total)
+
+    medians = {name: statistics.median(values) for name, values in cumulative.items()}
+    print(f"import {args.module}: {medians[args.module] / 1000:.1f} ms (median of {args.runs} runs)\n")
+    print(f"{'module':<60}{'cumulative ms':>15}")
+    for name, value in sorted(medians.items(), key=lambda item: item[1], reverse=True)[: args.top]:
+        print(f"{name:<60}{value / 1000:>15.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
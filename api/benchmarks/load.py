@@ -0,0 +1,140 @@
+"""End-to-end load scenarios against the ASGI app, in process (no network, no uvicorn)."""
+import uuid
+from typing import List
+
+import httpx
+from sqlalchemy import delete, func, select
+
+from benchmarks.common import BenchResult, close_session, measure, open_session
+from config import settings
+from cruds import async_user_crud
+from models import User
+from schemas.user import UserCreateHashed
+from services.auth import ADMIN_EMAIL
+from services.security import hash_password
+
+BENCH_PREFIX = "bench-load-"
+PASSWORD = "benchmark-password"
+
+
+def _count_users(db) -> int:
+    return db.scalar(select(func.count()).select_from(User))
+
+
+def _cleanup(db) -> None:
+    db.execute(delete(User).where(User.email.like(f"{BENCH_PREFIX}%")))
+    db.commit()
+
+
+async def _seed(admin_rows: int, login_users: int) -> None:
+    """Login users share one precomputed hash, so seeding 100k rows costs no bcrypt."""
+    hashed = await hash_password(PASSWORD)
+    db = open_session()
+    try:
+        if not await async_user_crud.get_one(db, email=ADMIN_EMAIL):
+            await async_user_crud.create(
+                db, UserCreateHashed(email=ADMIN_EMAIL, username="admin", hashed_password=hashed)
+            )
+
+        missing = max(login_users, admin_rows - await async_user_crud.run(db, _count_users))
+        rows = [
+            UserCreateHashed(
+                email=f"{BENCH_PREFIX}{i}@example.com", username=f"{BENCH_PREFIX}{i}", hashed_password=hashed
+            )
+            for i in range(missing)
+        ]
+        await async_user_crud.bulk_create(db, rows)
+    finally:
+        await close_session(db)
+
+
+async def _clean() -> None:
+    db = open_session()
+    try:
+        await async_user_crud.run(db, _cleanup)
+    finally:
+        await close_session(db)
+
+
+async def _login(client: httpx.AsyncClient, email: str) -> str:
+    response = await client.post("/auth/login", data={"username": email, "password": PASSWORD})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+def _expect(response: httpx.Response, *codes: int) -> httpx.Response:
+    if response.status_code not in codes:
+        raise RuntimeError(f"{response.request.method} {response.request.url} -> {response.status_code}: {response.text}")
+    return response
+
+
+async def run(app, requests: int, concurrency: int, admin_rows: int, keep_data: bool = False) -> List[BenchResult]:
+    login_users = min(requests, 1000)
+    await _seed(admin_rows, login_users)
+    # Every scenario comes from one client address; measure the handlers, not the auth throttling
+    rate_limit_enabled, settings.RATE_LIMIT_ENABLED = settings.RATE_LIMIT_ENABLED, False
+    # Nor the load shedding: the scenarios deliberately run past the admin and auth limits
+    admission_enabled, settings.ADMISSION_ENABLED = settings.ADMISSION_ENABLED, False
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        try:
+            results = []
+            run_id = uuid.uuid4().hex[:8]
+
+            async def register(i):
+                suffix = f"r{run_id}-{i}"
+                _expect(await client.post("/auth/register", json={
+                    "email": f"{BENCH_PREFIX}{suffix}@example.com",
+                    "username": f"{BENCH_PREFIX}{suffix}",
+                    "password": PASSWORD,
+                }), 200)
+
+            results.append(await measure(
+                "load.register storm", register, requests, concurrency, route="POST /auth/register"
+            ))
+
+            async def login(i):
+                await _login(client, f"{BENCH_PREFIX}{i % login_users}@example.com")
+
+            results.append(await measure("load.login storm", login, requests, concurrency, route="POST /auth/login"))
+
+            headers = {"Authorization": f"Bearer {await _login(client, f'{BENCH_PREFIX}0@example.com')}"}
+
+            async def read_profile(i):
+                _expect(await client.get("/user", headers=headers), 200)
+
+            results.append(await measure("load.GET /user", read_profile, requests, concurrency, route="GET /user"))
+
+            admin_headers = {"Authorization": f"Bearer {await _login(client, ADMIN_EMAIL)}"}
+
+            async def list_users(i):
+                _expect(await client.get("/admin/users", headers=admin_headers), 200)
+
+            results.append(await measure(
+                "load.GET /admin/users (1000 rows)",
+                list_users,
+                max(1, requests // 10),
+                concurrency,
+                route="GET /admin/users",
+            ))
+
+            async def stream_users(i):
+                async with client.stream("GET", "/admin/users/stream", headers=admin_headers) as response:
+                    _expect(response, 200)
+                    async for _ in response.aiter_raw():
+                        pass
+
+            results.append(await measure(
+                f"load.stream /admin/users ({admin_rows} rows)",
+                stream_users,
+                3,
+                1,
+                route="GET /admin/users/stream",
+            ))
+            return results
+        finally:
+            settings.RATE_LIMIT_ENABLED = rate_limit_enabled
+            settings.ADMISSION_ENABLED = admission_enabled
+            if not keep_data:
+                await _clean()
@@ -0,0 +1,146 @@
+"""Micro-benchmarks of the building blocks: hashing, tokens, repository calls, serialisation."""
+import json
+import uuid
+from typing import Dict, List
+
+import jwt
+from sqlalchemy import delete
+
+from benchmarks.common import BenchResult, close_session, measure, open_session
+from config import settings
+from cruds import async_user_crud
+from models import User
+from schemas.user import USER_RESPONSE_COLUMNS, UserCreateHashed, UserResponse, user_rows_adapter
+from services.security import create_access_token, decode_token, hash_password, verify_password
+
+BENCH_PREFIX = "bench-micro-"
+
+
+async def _security(iterations: int) -> List[BenchResult]:
+    hashed = await hash_password("benchmark-password")
+    token = await create_access_token({"sub": "bench@example.com", "uid": 1, "roles": [], "ver": 0})
+    hash_iterations = max(1, iterations // 50)
+
+    return [
+        await measure("security.hash_password", lambda i: hash_password("benchmark-password"), hash_iterations),
+        await measure(
+            "security.verify_password", lambda i: verify_password("benchmark-password", hashed), hash_iterations
+        ),
+        await measure(
+            "security.create_access_token",
+            lambda i: create_access_token({"sub": "bench@example.com", "uid": i}),
+            iterations,
+        ),
+        await measure("security.decode_token (cached)", lambda i: decode_token(token), iterations),
+        await measure(
+            "security.decode_token (verify)",
+            # What every call paid before verified tokens were cached
+            lambda i: _jwt_decode(token),
+            iterations,
+        ),
+    ]
+
+
+async def _jwt_decode(token: str) -> Dict:
+    return jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
+
+
+async def _repository(iterations: int) -> List[BenchResult]:
+    db = open_session()
+    try:
+        seed = [
+            UserCreateHashed(
+                email=f"{BENCH_PREFIX}{i}@example.com", username=f"{BENCH_PREFIX}{i}", hashed_password="x"
+            )
+            for i in range(100)
+        ]
+        await async_user_crud.bulk_create(db, seed)
+
+        async def create(i):
+            suffix = uuid.uuid4().hex
+            await async_user_crud.create(
+                db,
+                UserCreateHashed(
+                    email=f"{BENCH_PREFIX}{suffix}@example.com", username=f"{BENCH_PREFIX}{suffix}", hashed_password="x"
+                ),
+            )
+
+        results = [
+            await measure(
+                "crud.get_one(email=)",
+                lambda i: async_user_crud.get_one(db, email=f"{BENCH_PREFIX}{i % 100}@example.com"),
+                iterations,
+            ),
+            await measure(
+                "crud.get_one(email=) legacy Query",
+                # What get_one did before the prebuilt lookup statements
+                lambda i: async_user_crud.run(db, _legacy_get_one, f"{BENCH_PREFIX}{i % 100}@example.com"),
+                iterations,
+            ),
+            await measure(
+                "build lookup: prebuilt statement",
+                lambda i: _build_prebuilt(f"{BENCH_PREFIX}{i % 100}@example.com"),
+                iterations,
+            ),
+            await measure(
+                "build lookup: legacy Query",
+                lambda i: _build_legacy(db, f"{BENCH_PREFIX}{i % 100}@example.com"),
+                iterations,
+            ),
+            await measure("crud.get_many(limit=100)", lambda i: async_user_crud.get_many(db, limit=100), iterations),
+            await measure("crud.create", create, max(1, iterations // 10)),
+        ]
+
+        users = await async_user_crud.get_many(db, limit=1000)
+        rows, _ = await async_user_crud.get_page(db, limit=1000, columns=USER_RESPONSE_COLUMNS)
+        results += [
+            await measure(
+                "serialize UserResponse x1000 (models)",
+                lambda i: _serialize(users),
+                max(1, iterations // 100),
+            ),
+            await measure(
+                "serialize UserRow x1000 (adapter)",
+                lambda i: _serialize_rows(rows),
+                max(1, iterations // 100),
+            ),
+        ]
+        return results
+    finally:
+        await async_user_crud.run(db, _cleanup)
+        await close_session(db)
+
+
+def _legacy_get_one(db, email: str):
+    return db.query(User).filter_by(email=email).first()
+
+
+async def _build_prebuilt(email: str):
+    # Statement and cache key, without the round trip
+    stmt = async_user_crud.repository._lookups[frozenset(("email",))]
+    return stmt._generate_cache_key(), {"email": email}
+
+
+async def _build_legacy(db, email: str):
+    session = db.sync_session if hasattr(db, "sync_session") else db
+    stmt = session.query(User).filter_by(email=email).limit(1).statement
+    return stmt._generate_cache_key()
+
+
+async def _serialize(users) -> bytes:
+    return json.dumps(
+        [UserResponse.model_validate(user).model_dump(mode="json") for user in users]
+    ).encode()
+
+
+async def _serialize_rows(rows) -> bytes:
+    return user_rows_adapter.dump_json(rows)
+
+
+def _cleanup(db) -> None:
+    db.execute(delete(User).where(User.email.like(f"{BENCH_PREFIX}%")))
+    db.commit()
+
+
+async def run(iterations: int) -> List[BenchResult]:
+    return await _security(iterations) + await _repository(iterations)
@@ -0,0 +1,81 @@
+"""
+Counts the database round trips of one registration, comparing the former
+check-then-create path with the single-statement UserCRUD.register path.
+
+Needs a migrated database reachable with the usual DB_* settings:
+
+    python -m benchmarks.register_roundtrips
+"""
+import uuid
+
+from sqlalchemy import event
+
+from cruds import user_crud
+from database.session import db_engine
+from schemas.user import UserCreateHashed
+
+
+class RoundTripCounter:
+    def __init__(self, engine):
+        self.statements = []
+        self.commits = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+        event.listen(engine, "commit", self._on_commit)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement.split(None, 1)[0].upper())
+
+    def _on_commit(self, conn):
+        self.commits += 1
+
+    def reset(self):
+        self.statements.clear()
+        self.commits = 0
+
+    @property
+    def total(self) -> int:
+        return len(self.statements) + self.commits
+
+
+def _new_user() -> UserCreateHashed:
+    suffix = uuid.uuid4().hex[:12]
+    return UserCreateHashed(
+        email=f"bench-{suffix}@example.com",
+        username=f"bench-{suffix}",
+        hashed_password="not-a-real-hash",
+    )
+
+
+def check_then_create(db, user_in: UserCreateHashed) -> int:
+    user_crud.get_one(db, email=user_in.email)
+    user_crud.get_one(db, username=user_in.username)
+    return user_crud.create(db, user_in).id
+
+
+def main() -> None:
+    engine = db_engine.engine
+    counter = RoundTripCounter(engine)
+    created = []
+
+    db = db_engine.session()
+    try:
+        for label, register in (
+            ("check-then-create", check_then_create),
+            ("single INSERT ... RETURNING", user_crud.register),
+        ):
+            user_in = _new_user()
+            counter.reset()
+            created.append(register(db, user_in))
+            print(
+                f"{label:<30} {counter.total} round trips "
+                f"({', '.join(counter.statements)} + {counter.commits} COMMIT)"
+            )
+    finally:
+        for user_id in created:
+            db.delete(user_crud.get_one(db, id=user_id))
+        db.commit()
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+from typing import Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
@@ -5,16 +6,105 @@ class Settings(BaseSettings):
 
     SERVER_HOST: str
     SERVER_PORT: int
+    # Production server (ENV not in test/dev): gunicorn + uvicorn workers, app preloaded
+    SERVER_WORKERS: Optional[int] = None  # None -> CPU count
+    SERVER_LOOP: str = "auto"  # auto | uvloop | asyncio
+    SERVER_HTTP: str = "auto"  # auto | httptools | h11
+    SERVER_LIMIT_CONCURRENCY: Optional[int] = None  # per worker; past it new requests get a 503
+    SERVER_BACKLOG: int = 2048
+    SERVER_KEEPALIVE: int = 5
+    SERVER_GRACEFUL_TIMEOUT: int = 30
+    # Containers running this app behind the load balancer; more than one needs the
+    # redis backends below so limits, idempotency keys and caches are shared
+    API_REPLICAS: int = 1
 
     DB_USER: str
     DB_PASSWORD: str
     DB_HOST: str
     DB_PORT: str
     DB_NAME: str
+    DB_ECHO: bool = False
+    # True: AsyncSession + asyncpg. False: Session + psycopg2 run in the threadpool.
+    DB_ASYNC: bool = False
+
+    # Connection pool (one per worker process)
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_POOL_TIMEOUT: int = 30
+    # Connections every worker of every replica may hold in total, kept under the
+    # server's max_connections; pools are shrunk to their share of it. None: no cap
+    DB_MAX_CONNECTIONS: Optional[int] = None
+
+    # Read replicas: comma-separated postgresql:// URLs. Empty -> everything on the primary
+    DB_REPLICA_URLS: str = ""
+    DB_REPLICA_MAX_LAG_SECONDS: float = 10.0
+    DB_REPLICA_CHECK_INTERVAL: float = 5.0
+    # After a write, the same user reads from the primary for this long (memory | redis)
+    DB_READ_YOUR_WRITES_SECONDS: float = 5.0
+    DB_STICKY_BACKEND: str = "memory"
+
+    # Rows per statement/commit in CRUDRepository bulk operations
+    DB_BULK_CHUNK_SIZE: int = 500
+
+    # Adaptive per-route-class concurrency limits; excess requests get 503 + Retry-After (admission.py)
+    ADMISSION_ENABLED: bool = True
+
+    # Opt-in slow query capture and EXPLAIN sampling (database.profiler)
+    DB_PROFILER_ENABLED: bool = False
+    DB_PROFILER_SLOW_MS: float = 50.0  # statements faster than this are not recorded; 0 records all
+    DB_PROFILER_MAX_FINGERPRINTS: int = 1000
+    DB_PROFILER_SEQ_SCAN_ROWS: int = 10000  # sequential scans over fewer rows are not flagged
+
+    # On-demand profiling of single admin requests (X-Profile header or ?profile=), needs pyinstrument
+    REQUEST_PROFILING_ENABLED: bool = False
+    REQUEST_PROFILING_INTERVAL: float = 0.001  # seconds between samples
+    REQUEST_PROFILING_DIR: str = "/tmp/profiles"  # where X-Profile: store writes
+
+    # Audit trail of CRUDRepository writes, written in the background in multi-row batches
+    AUDIT_ENABLED: bool = True
+    AUDIT_QUEUE_SIZE: int = 10000  # past it new records are dropped and counted
+    AUDIT_BATCH_SIZE: int = 500
+    AUDIT_FLUSH_INTERVAL: float = 1.0  # seconds
 
     JWT_SECRET_KEY: str
     JWT_ALGORITHM: str
     JWT_ACCESS_TOKEN_EXPIRE_MINUTES: int
+    # Verified-token cache (per process)
+    TOKEN_CACHE_SIZE: int = 10000
+
+    # Password hashing
+    BCRYPT_ROUNDS: int = 12
+    HASH_POOL_KIND: str = "thread"  # thread | process
+    HASH_POOL_WORKERS: Optional[int] = None  # None -> CPU count
+    HASH_POOL_MAX_PENDING: int = 64
+
+    # Shared store for caches when a "redis" backend is selected
+    REDIS_URL: Optional[str] = None
+
+    # Token-bucket throttling of the auth routes (memory | redis), per minute + burst
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_BACKEND: str = "memory"
+    RATE_LIMIT_SIZE: int = 100000  # buckets kept by the memory backend
+    RATE_LIMIT_LOGIN_IP_PER_MINUTE: int = 30
+    RATE_LIMIT_LOGIN_IP_BURST: int = 10
+    RATE_LIMIT_LOGIN_ACCOUNT_PER_MINUTE: int = 10
+    RATE_LIMIT_LOGIN_ACCOUNT_BURST: int = 5
+    RATE_LIMIT_REGISTER_IP_PER_MINUTE: int = 10
+    RATE_LIMIT_REGISTER_IP_BURST: int = 5
+
+    # Idempotency-Key on the write routes: stored responses (memory | redis)
+    IDEMPOTENCY_BACKEND: str = "memory"
+    IDEMPOTENCY_CACHE_SIZE: int = 10000
+    IDEMPOTENCY_TTL: int = 86400  # seconds a response is replayed for
+    IDEMPOTENCY_LOCK_SECONDS: int = 30  # in-flight marker, in case the worker dies mid-request
+    IDEMPOTENCY_WAIT_SECONDS: float = 10.0  # duplicates wait this long for the first, then 409
+
+    # Authenticated principal cache (memory | redis)
+    PRINCIPAL_CACHE_BACKEND: str = "memory"
+    PRINCIPAL_CACHE_TTL: int = 60
+    PRINCIPAL_CACHE_SIZE: int = 10000
 
     model_config = SettingsConfigDict(
         env_file_encoding="utf-8",
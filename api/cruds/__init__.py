@@ -1,5 +1,6 @@
-from cruds.user import user_crud
+from cruds.user import async_user_crud, user_crud
 
 __all__ = [
+    "async_user_crud",
     "user_crud",
 ]
\ No newline at end of file
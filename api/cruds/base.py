@@ -1,8 +1,20 @@
-from typing import List, Optional, Type, TypeVar, Any, Dict
+from datetime import datetime
+from typing import AsyncIterator, Callable, Iterator, List, Optional, Sequence, Set, Tuple, Type, TypeVar, Any, Dict, Union
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
-from sqlalchemy.exc import IntegrityError
+from dataclasses import dataclass, field
+from sqlalchemy import DateTime, UniqueConstraint, bindparam, event, func, insert, inspect, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, make_transient_to_detached
+from sqlalchemy.exc import DataError, DBAPIError, IntegrityError, SQLAlchemyError
+from sqlalchemy.sql import Select
 from fastapi import HTTPException
+from config import settings
+from database.routing import WROTE, remember_write
+from services import audit
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+import base64
+import json
 import re
 from log import get_logger
 
@@ -13,6 +25,43 @@ UpdateSchemaType = TypeVar("UpdateSchemaType", bound=BaseModel)
 log = get_logger(__name__)
 
 
+# Session.info keys: primary keys, by table, of the rows updated or deleted in the
+# current transaction, and of those whose transaction has committed since the last
+# AsyncCRUDRepository call picked them up
+CHANGED = "changed_rows"
+COMMITTED = "committed_rows"
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session: Session) -> None:
+    # Also fired when a savepoint is released; only the outermost commit counts
+    if session.in_nested_transaction():
+        return
+    changed = session.info.pop(CHANGED, None)
+    if changed:
+        committed = session.info.setdefault(COMMITTED, {})
+        for table, keys in changed.items():
+            committed.setdefault(table, set()).update(keys)
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session: Session) -> None:
+    if not session.in_nested_transaction():
+        session.info.pop(CHANGED, None)
+
+
+def _integrity_error_field(error: IntegrityError) -> Optional[str]:
+    """
+    Column named in a unique/foreign key violation, e.g. ``email``, if it can be found;
+    for an expression index such as ``lower(email::text)``, the column inside it.
+    """
+    match = re.search(r'key \((?P<field>.*?)\)=\(', str(error.orig).lower())
+    if not match:
+        return None
+    expression = re.fullmatch(r'\w+\((?P<column>\w+)(?:::\w+)?\)', match.group("field"))
+    return expression.group("column") if expression else match.group("field")
+
+
 def _parse_integrity_error(error: IntegrityError) -> str:
     msg = str(error.orig).lower()
 
@@ -36,24 +85,307 @@ def _parse_integrity_error(error: IntegrityError) -> str:
     return "Database integrity error."
 
 
+def encode_cursor(values: List[Any]) -> str:
+    """Opaque pagination token holding the ordering key of the last row of a page."""
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> List[Any]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor.")
+    if not isinstance(values, list):
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor.")
+    return values
+
+
+def _cursor_value(column: Any, value: Any) -> Any:
+    """
+    A decoded cursor value as ``column``'s Python type. Cursors come back from clients,
+    so anything else is a 400 rather than a failed comparison in the database.
+    """
+    if value is None and column.nullable:
+        return None
+    try:
+        if isinstance(column.type, DateTime):
+            return datetime.fromisoformat(value)
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return value
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor.")
+    # bool is an int, but never a valid key
+    if isinstance(value, bool) or not isinstance(value, python_type):
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor.")
+    return value
+
+
+@dataclass
+class BulkResult:
+    """Outcome of a bulk operation. ``errors`` holds ``{"index", "detail"}`` per rejected row."""
+    items: List[Any] = field(default_factory=list)
+    count: int = 0
+    errors: List[Dict[str, Any]] = field(default_factory=list)
+
+
 class CRUDRepository:
     def __init__(self, model: Type[ORMModel], m2m_fields: Optional[Dict[str, Any]] = None):
         self._model = model
         self._name = model.__name__
         self._m2m_fields = m2m_fields or {}
+        self._lookups = self._build_lookups()
+
+    def _lookup_shapes(self) -> List[Tuple[str, ...]]:
+        """Column sets that identify one row: the primary key and every unique column or constraint."""
+        table = self._model.__table__
+        shapes = [tuple(column.key for column in self._model.__mapper__.primary_key)]
+        shapes += [(column.key,) for column in table.columns if column.unique]
+        shapes += [
+            tuple(column.key for column in constraint.columns)
+            for constraint in table.constraints
+            if isinstance(constraint, UniqueConstraint)
+        ]
+        shapes += [tuple(column.key for column in index.columns) for index in table.indexes if index.unique]
+        return shapes
+
+    def _build_lookups(self) -> Dict[frozenset, Select]:
+        """
+        One prebuilt ``SELECT ... WHERE col = :col`` per lookup shape. Reusing the same
+        statement object skips building a query and computing its cache key on every
+        call; only the bound values change.
+        """
+        return {
+            frozenset(shape): select(self._model).where(
+                *(getattr(self._model, key) == bindparam(key) for key in shape)
+            )
+            for shape in self._lookup_shapes()
+        }
 
     def get_one(self, db: Session, *args, **kwargs) -> Optional[ORMModel]:
-        return db.query(self._model).filter(*args).filter_by(**kwargs).first()
+        # None must become IS NULL, which a bound parameter cannot express
+        stmt = None if args or None in kwargs.values() else self._lookups.get(frozenset(kwargs))
+        if stmt is not None:
+            return db.execute(stmt, kwargs).scalars().first()
+        return db.scalars(self.select(*args, **kwargs).limit(1)).first()
 
     def get_many(self, db: Session, *args, skip: int = 0, limit: int = 1000, **kwargs) -> List[ORMModel]:
-        return (
-            db.query(self._model)
-            .filter(*args)
-            .filter_by(**kwargs)
-            .offset(skip)
-            .limit(limit)
-            .all()
-        )
+        return list(db.scalars(self.select(*args, **kwargs).offset(skip).limit(limit)))
+
+    def select(self, *args, columns: Optional[Sequence[str]] = None, **kwargs) -> Select:
+        """
+        SELECT of whole instances, or with ``columns`` of just those attributes; the
+        latter yields plain rows and skips building ORM objects entirely.
+        """
+        if columns:
+            entities = [getattr(self._model, column) for column in columns]
+            stmt = select(*entities).select_from(self._model)
+        else:
+            stmt = select(self._model)
+        return stmt.filter(*args).filter_by(**kwargs)
+
+    def _order_columns(self, order_by: str) -> list:
+        pk = self._model.__mapper__.primary_key[0]
+        if order_by == pk.key:
+            return [pk]
+        column = self._model.__table__.columns.get(order_by)
+        if column is None:
+            raise HTTPException(status_code=400, detail=f"Cannot order {self._name} by '{order_by}'.")
+        # The primary key breaks ties so the ordering is total
+        return [column, pk]
+
+    def get_page(
+        self,
+        db: Session,
+        *args,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        order_by: str = "id",
+        columns: Optional[Sequence[str]] = None,
+        **kwargs,
+    ) -> Tuple[List[Any], Optional[str]]:
+        """
+        Keyset pagination: rows strictly after ``cursor`` in ``order_by`` order. Unlike
+        OFFSET, the cost of a page does not grow with its position when the ordering
+        columns are indexed. Returns the rows and the cursor of the next page, if any.
+
+        With ``columns`` the rows are dicts of those columns instead of instances.
+        """
+        order_columns = self._order_columns(order_by)
+        stmt = self.select(*args, columns=columns, **kwargs)
+
+        if cursor:
+            values = decode_cursor(cursor)
+            if len(values) != len(order_columns):
+                raise HTTPException(status_code=400, detail="Invalid pagination cursor.")
+            values = [_cursor_value(column, value) for column, value in zip(order_columns, values)]
+            stmt = stmt.where(tuple_(*order_columns) > tuple_(*values))
+
+        stmt = stmt.order_by(*order_columns).limit(limit + 1)
+        if columns:
+            rows = [dict(row) for row in db.execute(stmt).mappings()]
+            key_of = lambda row, column: row[column.key]
+        else:
+            rows = list(db.scalars(stmt))
+            key_of = lambda row, column: getattr(row, column.key)
+
+        if len(rows) <= limit:
+            return rows, None
+
+        rows = rows[:limit]
+        return rows, encode_cursor([key_of(rows[-1], column) for column in order_columns])
+
+    def iter_batches(
+        self, db: Session, *args, batch_size: int = 500, columns: Optional[Sequence[str]] = None, **kwargs
+    ) -> Iterator[List[Any]]:
+        """
+        Yield every matching row in primary key order, in lists of up to ``batch_size``,
+        fetched through a server-side cursor so memory stays flat whatever the table size.
+        With ``columns`` the rows are dicts of those columns instead of instances.
+        """
+        stmt = self.stream_statement(*args, batch_size=batch_size, columns=columns, **kwargs)
+        result = db.execute(stmt).mappings() if columns else db.scalars(stmt)
+        for batch in result.partitions():
+            yield [dict(row) for row in batch] if columns else batch
+
+    def stream_statement(
+        self, *args, batch_size: int = 500, columns: Optional[Sequence[str]] = None, **kwargs
+    ) -> Select:
+        pk = self._model.__mapper__.primary_key[0]
+        return self.select(*args, columns=columns, **kwargs).order_by(pk).execution_options(yield_per=batch_size)
+
+    def get_version(
+        self, db: Session, *args, column: str = "updated_at", **kwargs
+    ) -> Tuple[int, Optional[datetime]]:
+        """
+        ``(count, max(column))`` of the matching rows in one aggregate query: changes
+        whenever a row is inserted, deleted or updated, without loading any of them.
+        """
+        stmt = select(func.count(), func.max(getattr(self._model, column))).select_from(self._model)
+        count, last_modified = db.execute(stmt.filter(*args).filter_by(**kwargs)).one()
+        return count, last_modified
+
+    @staticmethod
+    def _relation_name(field: str) -> str:
+        return field.replace("_ids", "")
+
+    def _load_related(self, db: Session, model_class: Type[Any], ids: Sequence[Any]) -> List[Any]:
+        """Fetch every id with a single ``WHERE pk IN (...)``; unknown ids are a 400."""
+        ids = [i for i in dict.fromkeys(ids) if i is not None]
+        if not ids:
+            return []
+
+        pk = model_class.__mapper__.primary_key[0]
+        found = {getattr(obj, pk.key): obj for obj in db.scalars(select(model_class).where(pk.in_(ids)))}
+        missing = [i for i in ids if i not in found]
+        if missing:
+            raise HTTPException(
+                status_code=400,
+                detail=f"{model_class.__name__} not found for ids: {', '.join(map(str, missing))}.",
+            )
+        return [found[i] for i in ids]
+
+    def _resolve_relations(self, db: Session, obj_data: Dict[str, Any]) -> Dict[str, List[Any]]:
+        """
+        Pop the ``*_ids`` fields present in ``obj_data`` and load their targets, keyed by
+        relationship name. Fields absent from the payload leave the relation untouched.
+        """
+        return {
+            self._relation_name(field): self._load_related(db, model_class, obj_data.pop(field) or [])
+            for field, model_class in self._m2m_fields.items()
+            if field in obj_data
+        }
+
+    @staticmethod
+    def _sync_relation(db_obj: ORMModel, rel_name: str, targets: List[Any]) -> None:
+        """Apply only the difference, so unchanged association rows are not rewritten."""
+        collection = getattr(db_obj, rel_name)
+        wanted = set(targets)
+        current = set(collection)
+        for obj in current - wanted:
+            collection.remove(obj)
+        for obj in targets:
+            if obj not in current:
+                collection.append(obj)
+
+    def dump_cached(self, db_obj: ORMModel) -> Dict[str, Any]:
+        """
+        Column values of ``db_obj`` as a JSON-safe dict, for caching. Columns listed in
+        the model's ``__cache_exclude__`` (secrets) are left out.
+        """
+        exclude = getattr(self._model, "__cache_exclude__", ())
+        data = {}
+        for column in self._model.__table__.columns:
+            if column.key in exclude:
+                continue
+            value = getattr(db_obj, column.key)
+            if isinstance(value, datetime):
+                value = value.isoformat()
+            data[column.key] = value
+        return data
+
+    def attach_cached(self, db: Session, data: Dict[str, Any]) -> ORMModel:
+        """
+        Rebuild an instance from ``dump_cached`` output and attach it to ``db`` as a
+        persistent object, without a SELECT. Later updates and deletes work as usual;
+        columns missing from ``data`` stay unloaded and are read from the row on access.
+        """
+        values = {}
+        for column in self._model.__table__.columns:
+            if column.key not in data:
+                continue
+            value = data[column.key]
+            if value is not None and isinstance(column.type, DateTime):
+                value = datetime.fromisoformat(value)
+            values[column.key] = value
+
+        db_obj = self._model(**values)
+        make_transient_to_detached(db_obj)
+        db.add(db_obj)
+        return db_obj
+
+    def refresh(self, db: Session, db_obj: ORMModel) -> ORMModel:
+        """Reload ``db_obj`` from the database, e.g. one rebuilt by ``attach_cached``."""
+        db.refresh(db_obj)
+        return db_obj
+
+    def unloaded_columns(self, db_obj: ORMModel) -> List[str]:
+        return [column.key for column in self._model.__table__.columns if column.key in inspect(db_obj).unloaded]
+
+    def load_unloaded(self, db: Session, db_obj: ORMModel) -> ORMModel:
+        """Read the columns ``attach_cached`` left out, in one SELECT; none if all are loaded."""
+        columns = self.unloaded_columns(db_obj)
+        if columns:
+            db.refresh(db_obj, attribute_names=columns)
+        return db_obj
+
+    @staticmethod
+    def _identity(obj: Any) -> str:
+        """Primary key of a mapped instance as audit ``entity_id``, comma-joined when composite."""
+        return ",".join(str(value) for value in type(obj).__mapper__.primary_key_from_instance(obj))
+
+    def _column_values(self, db_obj: ORMModel) -> Dict[str, Any]:
+        return {attr.key: getattr(db_obj, attr.key) for attr in self._model.__mapper__.column_attrs}
+
+    def _related_ids(self, targets: List[Any]) -> List[str]:
+        return [self._identity(target) for target in targets]
+
+    def _record(
+        self,
+        db: Session,
+        action: str,
+        entity_id: Any,
+        old: Optional[Dict[str, Any]] = None,
+        new: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """Audit a change and note the key of a changed row for ``AsyncCRUDRepository.committed``."""
+        audit.record(db, self._model, action, entity_id, old=old, new=new)
+        if action != "create":
+            changed = db.info.setdefault(CHANGED, {})
+            changed.setdefault(self._model.__tablename__, set()).add(str(entity_id))
 
     def create(self, db: Session, obj_create: CreateSchemaType) -> ORMModel:
         if not isinstance(obj_create, BaseModel):
@@ -64,23 +396,28 @@ class CRUDRepository:
 
         try:
             obj_data = obj_create.model_dump(exclude_unset=True)
-            m2m_data = {
-                field: [db.get(model_class, i) for i in obj_data.pop(field, [])]
-                for field, model_class in self._m2m_fields.items()
-            }
+            m2m_data = self._resolve_relations(db, obj_data)
 
             db_obj = self._model(**obj_data)
-            db.add(db_obj)
-            db.commit()
-            db.refresh(db_obj)
-
-            for field, rel_objs in m2m_data.items():
-                setattr(db_obj, field.replace("_ids", ""), rel_objs)
+            for rel_name, rel_objs in m2m_data.items():
+                setattr(db_obj, rel_name, rel_objs)
 
+            db.add(db_obj)
+            # Flushed first so the audit record has the generated key; still one transaction
+            db.flush()
+            new = self._column_values(db_obj)
+            new.update({rel_name: self._related_ids(rel_objs) for rel_name, rel_objs in m2m_data.items()})
+            self._record(db, "create", self._identity(db_obj), new=new)
             db.commit()
-            db.refresh(db_obj)
+            # Sessions that keep attributes after commit already hold every value
+            if db.expire_on_commit:
+                db.refresh(db_obj)
             return db_obj
 
+        except HTTPException:
+            db.rollback()
+            raise
+
         except IntegrityError as e:
             db.rollback()
             log.error("Integrity error while creating %s: %s", self._name, str(e))
@@ -91,32 +428,52 @@ class CRUDRepository:
             log.exception("Unexpected error while creating %s:", self._name)
             raise HTTPException(status_code=500, detail="Unexpected error while creating the record.")
 
-    def update(self, db: Session, db_obj: ORMModel, obj_update: UpdateSchemaType) -> ORMModel:
+    def update(
+        self,
+        db: Session,
+        db_obj: ORMModel,
+        obj_update: UpdateSchemaType,
+        precondition: Optional[Callable[[ORMModel], None]] = None,
+    ) -> ORMModel:
+        """
+        Apply the fields set in ``obj_update``. With ``precondition``, the row is first
+        reloaded with ``SELECT ... FOR UPDATE`` and passed to it; it raises (e.g. a 412)
+        to abort. The lock is held until the commit, so no other write gets in between.
+        """
         try:
+            if precondition is not None:
+                db.refresh(db_obj, with_for_update=True)
+                precondition(db_obj)
+
             obj_data = obj_update.model_dump(exclude_unset=True)
+            m2m_data = self._resolve_relations(db, obj_data)
             obj_data = {key: value for key, value in obj_data.items() if value is not None}
 
+            old, new = {}, {}
             for field, value in obj_data.items():
-                setattr(db_obj, field, value)
-
-            m2m_data = {}
-            for field, model_class in self._m2m_fields.items():
-                ids = obj_data.pop(field, [])
-                if not ids:
-                    m2m_data[field] = []
-                else:
-                    ids = [id for id in ids if id is not None]
-                    m2m_data[field] = [db.get(model_class, i) for i in ids]
+                current = getattr(db_obj, field)
+                if current != value:
+                    old[field], new[field] = current, value
+            for rel_name, rel_objs in m2m_data.items():
+                old[rel_name] = self._related_ids(getattr(db_obj, rel_name))
+                new[rel_name] = self._related_ids(rel_objs)
 
             for field, value in obj_data.items():
                 setattr(db_obj, field, value)
-            for field, rel_objs in m2m_data.items():
-                setattr(db_obj, field.replace("_ids", ""), rel_objs)
+            for rel_name, rel_objs in m2m_data.items():
+                self._sync_relation(db_obj, rel_name, rel_objs)
 
+            if old:
+                self._record(db, "update", self._identity(db_obj), old=old, new=new)
             db.commit()
-            db.refresh(db_obj)
+            if db.expire_on_commit:
+                db.refresh(db_obj)
             return db_obj
 
+        except HTTPException:
+            db.rollback()
+            raise
+
         except IntegrityError as e:
             db.rollback()
             log.error("Integrity error while updating %s: %s", self._name, str(e))
@@ -130,11 +487,12 @@ class CRUDRepository:
     def delete(self, db: Session, db_obj: ORMModel) -> ORMModel:
         try:
             for field in self._m2m_fields.keys():
-                rel_field = field.replace("_ids", "")
-                if hasattr(db_obj, rel_field):
-                    getattr(db_obj, rel_field).clear()
-            db.commit()
+                rel_name = self._relation_name(field)
+                if hasattr(db_obj, rel_name):
+                    getattr(db_obj, rel_name).clear()
 
+            # Association rows and the record itself go in the same transaction
+            self._record(db, "delete", self._identity(db_obj), old=self._column_values(db_obj))
             db.delete(db_obj)
             db.commit()
             return db_obj
@@ -148,3 +506,257 @@ class CRUDRepository:
             db.rollback()
             log.exception("Unexpected error while deleting %s:", self._name)
             raise HTTPException(status_code=500, detail="Unexpected error while deleting the record.")
+
+    def _bulk_rows(self, objs: Sequence[Union[BaseModel, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        rows = []
+        for obj in objs:
+            row = obj.model_dump(exclude_unset=True) if isinstance(obj, BaseModel) else dict(obj)
+            for m2m_field in self._m2m_fields:
+                if row.pop(m2m_field, None):
+                    raise HTTPException(status_code=400, detail=f"Bulk operations do not support '{m2m_field}'.")
+            rows.append(row)
+        return rows
+
+    def _run_chunks(
+        self,
+        db: Session,
+        rows: List[Dict[str, Any]],
+        chunk_size: Optional[int],
+        execute: Callable[[List[Dict[str, Any]]], List[ORMModel]],
+        action: str,
+    ) -> BulkResult:
+        """
+        Apply ``execute`` to ``rows`` one chunk (one statement, one commit) at a time.
+        When a chunk violates a constraint or has a value the database rejects, it is
+        replayed row by row inside savepoints, so every bad row is reported and the rest
+        of the chunk is still written. If the replay itself fails, e.g. on a dropped
+        connection, the chunk is rolled back and it is a 500.
+        """
+        chunk_size = chunk_size or settings.DB_BULK_CHUNK_SIZE
+        result = BulkResult()
+
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            try:
+                items = execute(chunk)
+                db.commit()
+                result.items.extend(items)
+                result.count += len(chunk)
+                continue
+            except (IntegrityError, DataError):
+                db.rollback()
+            except Exception:
+                db.rollback()
+                log.exception("Unexpected error while bulk %s %s:", action, self._name)
+                raise HTTPException(status_code=500, detail=f"Unexpected error while {action} the records.")
+
+            try:
+                for offset, row in enumerate(chunk):
+                    try:
+                        with db.begin_nested():
+                            items = execute([row])
+                        result.items.extend(items)
+                        result.count += 1
+                    except IntegrityError as e:
+                        result.errors.append({"index": start + offset, "detail": _parse_integrity_error(e)})
+                    except DBAPIError as e:
+                        if e.connection_invalidated:
+                            raise
+                        # A value the column rejects (bad type, out of range, too long ...)
+                        result.errors.append({"index": start + offset, "detail": "Invalid values for this record."})
+                db.commit()
+            except SQLAlchemyError:
+                # The connection or transaction is gone: nothing of this chunk was kept
+                db.rollback()
+                log.exception("Unexpected error while bulk %s %s:", action, self._name)
+                raise HTTPException(status_code=500, detail=f"Unexpected error while {action} the records.")
+
+        if result.errors:
+            log.warning("Bulk %s %s: %d rows rejected", action, self._name, len(result.errors))
+        return result
+
+    def bulk_create(
+        self,
+        db: Session,
+        objs: Sequence[Union[CreateSchemaType, Dict[str, Any]]],
+        chunk_size: Optional[int] = None,
+    ) -> BulkResult:
+        """Insert many rows with multi-row INSERT ... RETURNING, one commit per chunk."""
+        stmt = insert(self._model).returning(self._model)
+
+        def execute(chunk):
+            items = list(db.scalars(stmt, chunk))
+            for item in items:
+                self._record(db, "create", self._identity(item), new=self._column_values(item))
+            return items
+
+        return self._run_chunks(db, self._bulk_rows(objs), chunk_size, execute, "creating")
+
+    def bulk_update(
+        self,
+        db: Session,
+        objs: Sequence[Union[UpdateSchemaType, Dict[str, Any]]],
+        chunk_size: Optional[int] = None,
+    ) -> BulkResult:
+        """
+        UPDATE many rows by primary key (executemany, one commit per chunk). Every row
+        must include the primary key; only the other keys present are written.
+        """
+        pk = self._model.__mapper__.primary_key[0].key
+        rows = self._bulk_rows(objs)
+        if any(pk not in row for row in rows):
+            raise HTTPException(status_code=400, detail=f"Every row must include '{pk}'.")
+
+        def execute(chunk):
+            db.execute(update(self._model), chunk)
+            # Rows are not loaded, so only the new values are known
+            for row in chunk:
+                self._record(db, "update", row[pk], new={k: v for k, v in row.items() if k != pk})
+            return []
+
+        return self._run_chunks(db, rows, chunk_size, execute, "updating")
+
+    def bulk_upsert(
+        self,
+        db: Session,
+        objs: Sequence[Union[CreateSchemaType, Dict[str, Any]]],
+        index_elements: Sequence[str],
+        chunk_size: Optional[int] = None,
+    ) -> BulkResult:
+        """
+        INSERT ... ON CONFLICT (``index_elements``) DO UPDATE ... RETURNING, one
+        multi-row statement and one commit per chunk.
+        """
+        table = self._model.__table__
+
+        def execute(chunk):
+            stmt = pg_insert(self._model).values(chunk)
+            provided = set().union(*(row.keys() for row in chunk))
+            set_ = {
+                column.key: stmt.excluded[column.key]
+                for column in table.columns
+                if not column.primary_key
+                and column.key not in index_elements
+                and (column.key in provided or column.onupdate is not None)
+            }
+            stmt = stmt.on_conflict_do_update(index_elements=list(index_elements), set_=set_)
+            stmt = stmt.returning(self._model).execution_options(populate_existing=True)
+            items = list(db.scalars(stmt))
+            for item in items:
+                self._record(db, "upsert", self._identity(item), new=self._column_values(item))
+            return items
+
+        return self._run_chunks(db, self._bulk_rows(objs), chunk_size, execute, "upserting")
+
+
+class AsyncCRUDRepository:
+    """
+    Awaitable front for a CRUDRepository, used by the async routes.
+
+    With an AsyncSession (DB_ASYNC=true) the repository logic runs through
+    ``AsyncSession.run_sync`` on the asyncpg connection, so the event loop is never
+    blocked on I/O. With a plain Session it runs in the threadpool instead. Either way
+    the query logic lives only once, in the wrapped CRUDRepository.
+    """
+
+    def __init__(self, repository: CRUDRepository):
+        self._repository = repository
+
+    @property
+    def repository(self) -> CRUDRepository:
+        return self._repository
+
+    async def run(self, db: Union[Session, AsyncSession], fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run ``fn(sync_session, *args, **kwargs)`` without blocking the event loop."""
+        try:
+            if isinstance(db, AsyncSession):
+                result = await db.run_sync(fn, *args, **kwargs)
+            else:
+                result = await run_in_threadpool(fn, db, *args, **kwargs)
+        finally:
+            # Also when fn fails after committing, e.g. a later bulk chunk
+            committed = db.info.pop(COMMITTED, None)
+            if committed:
+                await self.committed(committed)
+        if db.info.get(WROTE):
+            # Routed sessions only: keep this user's next reads on the primary
+            await remember_write(db)
+        return result
+
+    async def committed(self, changed: Dict[str, Set[str]]) -> None:
+        """
+        Called by ``run`` with the primary keys, by table, of the rows a call updated
+        or deleted in committed transactions; e.g. to drop what is cached about them.
+        """
+
+    async def get_one(self, db: Union[Session, AsyncSession], *args, **kwargs) -> Optional[ORMModel]:
+        return await self.run(db, self._repository.get_one, *args, **kwargs)
+
+    async def get_many(self, db: Union[Session, AsyncSession], *args, **kwargs) -> List[ORMModel]:
+        return await self.run(db, self._repository.get_many, *args, **kwargs)
+
+    def attach_cached(self, db: Union[Session, AsyncSession], data: Dict[str, Any]) -> ORMModel:
+        # No I/O involved, AsyncSession.add proxies straight to the sync session
+        return self._repository.attach_cached(db, data)
+
+    async def refresh(self, db: Union[Session, AsyncSession], db_obj: ORMModel) -> ORMModel:
+        return await self.run(db, self._repository.refresh, db_obj)
+
+    async def load_unloaded(self, db: Union[Session, AsyncSession], db_obj: ORMModel) -> ORMModel:
+        # Also before serialising: with an AsyncSession a lazy load outside run_sync fails
+        if not self._repository.unloaded_columns(db_obj):
+            return db_obj
+        return await self.run(db, self._repository.load_unloaded, db_obj)
+
+    async def get_page(self, db: Union[Session, AsyncSession], *args, **kwargs) -> Tuple[List[ORMModel], Optional[str]]:
+        return await self.run(db, self._repository.get_page, *args, **kwargs)
+
+    async def get_version(self, db: Union[Session, AsyncSession], *args, **kwargs) -> Tuple[int, Optional[datetime]]:
+        return await self.run(db, self._repository.get_version, *args, **kwargs)
+
+    async def iter_batches(
+        self,
+        db: Union[Session, AsyncSession],
+        *args,
+        batch_size: int = 500,
+        columns: Optional[Sequence[str]] = None,
+        **kwargs,
+    ) -> AsyncIterator[List[Any]]:
+        if isinstance(db, AsyncSession):
+            stmt = self._repository.stream_statement(*args, batch_size=batch_size, columns=columns, **kwargs)
+            if columns:
+                result = (await db.stream(stmt)).mappings()
+                async for batch in result.partitions():
+                    yield [dict(row) for row in batch]
+            else:
+                result = await db.stream_scalars(stmt)
+                async for batch in result.partitions():
+                    yield batch
+        else:
+            batches = self._repository.iter_batches(db, *args, batch_size=batch_size, columns=columns, **kwargs)
+            async for batch in iterate_in_threadpool(batches):
+                yield batch
+
+    async def create(self, db: Union[Session, AsyncSession], obj_create: CreateSchemaType) -> ORMModel:
+        return await self.run(db, self._repository.create, obj_create)
+
+    async def update(
+        self,
+        db: Union[Session, AsyncSession],
+        db_obj: ORMModel,
+        obj_update: UpdateSchemaType,
+        precondition: Optional[Callable[[ORMModel], None]] = None,
+    ) -> ORMModel:
+        return await self.run(db, self._repository.update, db_obj, obj_update, precondition)
+
+    async def delete(self, db: Union[Session, AsyncSession], db_obj: ORMModel) -> ORMModel:
+        return await self.run(db, self._repository.delete, db_obj)
+
+    async def bulk_create(self, db: Union[Session, AsyncSession], objs, **kwargs) -> BulkResult:
+        return await self.run(db, self._repository.bulk_create, objs, **kwargs)
+
+    async def bulk_update(self, db: Union[Session, AsyncSession], objs, **kwargs) -> BulkResult:
+        return await self.run(db, self._repository.bulk_update, objs, **kwargs)
+
+    async def bulk_upsert(self, db: Union[Session, AsyncSession], objs, index_elements, **kwargs) -> BulkResult:
+        return await self.run(db, self._repository.bulk_upsert, objs, index_elements, **kwargs)
@@ -1,11 +1,127 @@
+from typing import Any, Dict, List, Sequence, Set, Tuple
+from fastapi import HTTPException
+from sqlalchemy import func, insert, or_, select, union_all
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
 from models import User
-from cruds.base import CRUDRepository
+from cruds.base import AsyncCRUDRepository, CRUDRepository, _integrity_error_field, _parse_integrity_error
+from schemas.user import UserCreateHashed
+from services import audit
+from services.cache import invalidate_principals
 from log import get_logger
 
 log = get_logger(__name__)
 
+DUPLICATE_FIELD_MESSAGES = {
+    "email": "El correo ya está registrado.",
+    "username": "El nombre de usuario ya está registrado.",
+}
+
+SEARCH_FIELDS = ("username", "email")
+# ESCAPE character of the prefix patterns; not a backslash, which PostgreSQL may read as a string escape
+LIKE_ESCAPE = "/"
+
+
+def _prefix_pattern(term: str) -> str:
+    for char in (LIKE_ESCAPE, "%", "_"):
+        term = term.replace(char, LIKE_ESCAPE + char)
+    return term + "%"
+
+
 class UserCRUD(CRUDRepository):
     def __init__(self) -> None:
         super().__init__(User)
 
+    def register(self, db: Session, user_in: UserCreateHashed) -> int:
+        """
+        Create a user with a single INSERT ... RETURNING id and one commit. Duplicate
+        emails/usernames are detected by the unique constraints, not by prior SELECTs,
+        so concurrent registrations cannot race past the check.
+        """
+        stmt = insert(User).values(**user_in.model_dump()).returning(User.id)
+        try:
+            user_id = db.execute(stmt).scalar_one()
+            audit.record(db, User, "create", user_id, new={"id": user_id, **user_in.model_dump()})
+            db.commit()
+            return user_id
+        except IntegrityError as e:
+            db.rollback()
+            field = _integrity_error_field(e)
+            detail = DUPLICATE_FIELD_MESSAGES.get(field) or _parse_integrity_error(e)
+            raise HTTPException(status_code=400, detail=detail)
+
+    def search(
+        self,
+        db: Session,
+        q: str,
+        mode: str = "prefix",
+        fields: Sequence[str] = SEARCH_FIELDS,
+        columns: Sequence[str] = ("id",),
+        limit: int = 20,
+        offset: int = 0,
+    ) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Users whose ``fields`` start with ``q`` (``prefix``) or resemble it (``fuzzy``),
+        ignoring case, best match first. Returns up to ``limit`` rows as dicts of
+        ``columns`` and whether there are more.
+
+        Prefix matches are ranked by the matching value, so an exact match comes first;
+        on PostgreSQL each field is read in the order of its prefix index and only as far
+        as the page needs. Fuzzy matching needs PostgreSQL's pg_trgm: the trigram indexes
+        find the rows over pg_trgm.similarity_threshold, ranked by similarity.
+        """
+        term = q.lower()
+        window = offset + limit + 1
+        postgresql = db.get_bind().dialect.name == "postgresql"
+        if mode == "fuzzy":
+            if not postgresql:
+                raise HTTPException(status_code=400, detail="Fuzzy search needs PostgreSQL (pg_trgm).")
+            keys = [func.lower(getattr(User, field)) for field in fields]
+            score = func.greatest(*(func.similarity(key, term) for key in keys)) if len(keys) > 1 else func.similarity(keys[0], term)
+            stmt = self.select(columns=columns).where(or_(*(key.op("%")(term) for key in keys)))
+            stmt = stmt.order_by(score.desc(), User.id)
+        else:
+            pattern = _prefix_pattern(term)
+            branches = []
+            for field in fields:
+                key = func.lower(getattr(User, field))
+                if postgresql:
+                    # The expression of the ix_users_lower_*_prefix indexes
+                    key = key.collate("C")
+                branch = (
+                    select(User.id.label("id"), key.label("rank"))
+                    .where(key.like(pattern, escape=LIKE_ESCAPE))
+                    .order_by(key, User.id)
+                    .limit(window)
+                    .subquery()
+                )
+                branches.append(select(branch))
+            matches = union_all(*branches).subquery()
+            # A user matching on both fields ranks by the better one
+            ranked = select(matches.c.id, func.min(matches.c.rank).label("rank")).group_by(matches.c.id).subquery()
+            stmt = self.select(columns=columns).join(ranked, User.id == ranked.c.id).order_by(ranked.c.rank, User.id)
+
+        rows = [dict(row) for row in db.execute(stmt.offset(offset).limit(limit + 1)).mappings()]
+        return rows[:limit], len(rows) > limit
+
+
+class AsyncUserCRUD(AsyncCRUDRepository):
+    """
+    Invalidates the cached principal of every user a committed write updated or
+    deleted, whichever repository method did it (bulk ones included).
+    """
+
+    async def committed(self, changed: Dict[str, Set[str]]) -> None:
+        user_ids = changed.get(User.__tablename__)
+        if user_ids:
+            await invalidate_principals(user_ids)
+
+    async def register(self, db, user_in: UserCreateHashed) -> int:
+        return await self.run(db, self.repository.register, user_in)
+
+    async def search(self, db, q: str, **kwargs) -> Tuple[List[Dict[str, Any]], bool]:
+        return await self.run(db, self.repository.search, q, **kwargs)
+
+
 user_crud = UserCRUD()
+async_user_crud = AsyncUserCRUD(user_crud)
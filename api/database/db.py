@@ -1,15 +1,39 @@
-from typing import Generator
-from database.session import get_local_session, SQLALCHEMY_DATABASE_URL
+from typing import AsyncGenerator, Generator, Union
+from fastapi import Request
+from database.routing import USE_PRIMARY
+from database.session import db_engine
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import Session
 from log import get_logger
 
 log = get_logger(__name__)
 
 Base = declarative_base()
 
-def get_db() -> Generator:
-    db = get_local_session(SQLALCHEMY_DATABASE_URL, False)()
+# Session type handed to routes by get_db, depending on settings.DB_ASYNC
+DBSession = Union[Session, AsyncSession]
+
+
+# With read replicas, only these requests may read from them; anything else stays on the primary
+READ_ONLY_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+
+def get_sync_db(request: Request) -> Generator:
+    db = db_engine.session()
+    if request.method not in READ_ONLY_METHODS:
+        db.info[USE_PRIMARY] = True
     try:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db(request: Request) -> AsyncGenerator:
+    async with db_engine.async_session() as db:
+        if request.method not in READ_ONLY_METHODS:
+            db.info[USE_PRIMARY] = True
+        yield db
+
+
+get_db = get_async_db if db_engine.async_mode else get_sync_db
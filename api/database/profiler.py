@@ -0,0 +1,293 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Connection, Engine
+from starlette.concurrency import run_in_threadpool
+
+from config import settings
+from database.session import db_engine
+from log import get_logger
+
+log = get_logger(__name__)
+
+# Execution option that keeps the profiler's own EXPLAINs out of the report
+SKIP_PROFILING = "skip_profiling"
+
+_WHITESPACE = re.compile(r"\s+")
+_PARAM = re.compile(r"%\(\w+\)s|%s|\$\d+|\?")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN \(\?(?:, \?)*\)", re.I)
+_VALUES_ROWS = re.compile(r"(\(\?(?:, \?)*\))(?:, \(\?(?:, \?)*\))+")
+
+_WHERE = re.compile(r"\bWHERE\b(?P<where>.*?)(?=\bGROUP BY\b|\bORDER BY\b|\bLIMIT\b|\bOFFSET\b|\bFOR UPDATE\b|$)", re.I | re.S)
+_ORDER_BY = re.compile(r"\bORDER BY\b(?P<order>.*?)(?=\bLIMIT\b|\bOFFSET\b|\bFOR UPDATE\b|$)", re.I | re.S)
+_OPERATOR = r"\s*(?P<op>=|!=|<>|<=|>=|<|>|\bI?LIKE\b|\bIN\b|\bIS\b)"
+_EQUALITY_OPS = {"=", "IN", "IS"}
+# SCAN reads the whole table (in index order when USING INDEX); SEARCH is an index lookup
+_SQLITE_SCAN = re.compile(r"^SCAN (?:TABLE )?(?P<table>\w+)\b")
+
+
+def fingerprint(statement: str) -> str:
+    """
+    The statement with every literal and bound parameter replaced by ``?``, IN lists
+    and multi-row VALUES collapsed, so executions that differ only in values match.
+    """
+    normalized = _WHITESPACE.sub(" ", statement).strip()
+    normalized = _STRING.sub("?", normalized)
+    normalized = _PARAM.sub("?", normalized)
+    normalized = _NUMBER.sub("?", normalized)
+    normalized = _IN_LIST.sub("IN (...)", normalized)
+    return _VALUES_ROWS.sub(r"\1, ...", normalized)
+
+
+def _indexed_columns(table_name: str) -> Dict[str, str]:
+    """Leading column of each index of ``table_name`` in the models' metadata, to the index name."""
+    from database.db import Base
+
+    table = Base.metadata.tables.get(table_name)
+    if table is None:
+        return {}
+    indexed = {column.key: f"unique {column.key}" for column in table.columns if column.unique}
+    for index in table.indexes:
+        if not index.expressions:
+            continue
+        # Expression indexes under the same key as suggest_index, e.g. lower(email)
+        leading = str(index.expressions[0]).replace(f"{table_name}.", "").lower()
+        indexed[leading] = index.name
+    primary_key = list(table.primary_key.columns)
+    if primary_key:
+        indexed[primary_key[0].key] = "primary key"
+    return indexed
+
+
+def suggest_index(statement: str, table: str) -> Dict[str, Any]:
+    """
+    Index for the columns of ``table`` that ``statement`` filters on (equalities first,
+    then ranges) followed by the ones it orders by. When the leading column already has
+    an index the planner chose not to use, that index is reported instead.
+    """
+    equalities: List[str] = []
+    ranges: List[str] = []
+    where = _WHERE.search(statement)
+    if where:
+        pattern = re.compile(rf"(?:(?P<func>\w+)\()?\b{table}\.(?P<column>\w+)\)?{_OPERATOR}", re.I)
+        for match in pattern.finditer(where.group("where")):
+            column = match.group("column")
+            key = f"{match.group('func').lower()}({column})" if match.group("func") else column
+            target = equalities if match.group("op").upper() in _EQUALITY_OPS else ranges
+            if key not in equalities and key not in ranges:
+                target.append(key)
+    order = _ORDER_BY.search(statement)
+    order_columns = re.findall(rf"\b{table}\.(\w+)", order.group("order")) if order else []
+
+    columns = equalities + ranges + [column for column in order_columns if column not in equalities + ranges]
+    if not columns:
+        return {"table": table, "columns": [], "suggestion": None}
+    existing = _indexed_columns(table).get(columns[0])
+    if existing:
+        return {"table": table, "columns": columns, "suggestion": None, "unused_index": existing}
+    name = "ix_{}_{}".format(table, "_".join(re.sub(r"\W+", "_", column).strip("_") for column in columns))
+    return {
+        "table": table,
+        "columns": columns,
+        "suggestion": f"CREATE INDEX CONCURRENTLY {name} ON {table} ({', '.join(columns)})",
+    }
+
+
+def _postgres_seq_scans(plan: Dict[str, Any]) -> List[Tuple[str, int]]:
+    scans = []
+    nodes = [plan["Plan"]]
+    while nodes:
+        node = nodes.pop()
+        if node.get("Node Type") == "Seq Scan":
+            loops = node.get("Actual Loops", 1)
+            rows = (node.get("Actual Rows", 0) + node.get("Rows Removed by Filter", 0)) * loops
+            scans.append((node["Relation Name"], int(rows)))
+        nodes.extend(node.get("Plans", ()))
+    return scans
+
+
+class QueryStats:
+    __slots__ = ("statement", "count", "total", "max", "sample", "plan")
+
+    def __init__(self, statement: str) -> None:
+        self.statement = statement
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        # (statement, parameters) of the slowest execution, replayed by EXPLAIN
+        self.sample: Optional[Tuple[str, Any]] = None
+        self.plan: Optional[Dict[str, Any]] = None
+
+
+class QueryProfiler:
+    """
+    Opt-in slow query capture. While enabled, engine events time every statement and
+    the ones over ``slow_ms`` are aggregated per fingerprint (count, total and max
+    time). ``sample_plans`` replays the slowest SELECT of the top fingerprints under
+    ``EXPLAIN (ANALYZE, BUFFERS)`` (``EXPLAIN QUERY PLAN`` on SQLite) and flags
+    sequential scans over ``seq_scan_rows`` rows, with an index suggestion.
+
+    The hooks run on whichever thread executes the query, hence the lock.
+    """
+
+    def __init__(self, slow_ms: float = 50.0, max_fingerprints: int = 1000, seq_scan_rows: int = 10000) -> None:
+        self.slow_ms = slow_ms
+        self.max_fingerprints = max_fingerprints
+        self.seq_scan_rows = seq_scan_rows
+        self.enabled = False
+        self.since: Optional[datetime] = None
+        self.overflow = 0
+        self._stats: Dict[str, QueryStats] = {}
+        self._lock = threading.Lock()
+
+    def enable(self) -> None:
+        if self.enabled:
+            return
+        event.listen(Engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", self._after_cursor_execute)
+        self.enabled = True
+        self.since = datetime.now()
+        log.info("Query profiler enabled (slow threshold %s ms).", self.slow_ms)
+
+    def disable(self) -> None:
+        if not self.enabled:
+            return
+        event.remove(Engine, "before_cursor_execute", self._before_cursor_execute)
+        event.remove(Engine, "after_cursor_execute", self._after_cursor_execute)
+        self.enabled = False
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+            self.overflow = 0
+        self.since = datetime.now()
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._profiler_start = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "_profiler_start", None)
+        if start is None or context.execution_options.get(SKIP_PROFILING):
+            return
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if elapsed_ms < self.slow_ms:
+            return
+        self.record(statement, None if executemany else parameters, elapsed_ms)
+
+    def record(self, statement: str, parameters: Any, elapsed_ms: float) -> None:
+        normalized = fingerprint(statement)
+        key = hashlib.blake2b(normalized.encode(), digest_size=8).hexdigest()
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                if len(self._stats) >= self.max_fingerprints:
+                    self.overflow += 1
+                    return
+                stats = self._stats[key] = QueryStats(normalized)
+            stats.count += 1
+            stats.total += elapsed_ms
+            if elapsed_ms >= stats.max:
+                stats.max = elapsed_ms
+                if parameters is not None:
+                    stats.sample = (statement, parameters)
+
+    def _top(self, limit: int) -> List[Tuple[str, QueryStats]]:
+        with self._lock:
+            items = list(self._stats.items())
+        return sorted(items, key=lambda item: item[1].total, reverse=True)[:limit]
+
+    def _explain(self, connection: Connection, statement: str, parameters: Any) -> Dict[str, Any]:
+        connection = connection.execution_options(**{SKIP_PROFILING: True})
+        if connection.dialect.name == "postgresql":
+            row = connection.exec_driver_sql(
+                "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + statement, parameters
+            ).scalar_one()
+            # psycopg2 decodes json, asyncpg hands back the text
+            plan = (json.loads(row) if isinstance(row, str) else row)[0]
+            scans = _postgres_seq_scans(plan)
+            summary = {
+                "execution_ms": plan.get("Execution Time"),
+                "shared_hit_blocks": plan["Plan"].get("Shared Hit Blocks"),
+                "shared_read_blocks": plan["Plan"].get("Shared Read Blocks"),
+            }
+        else:
+            details = [row[-1] for row in connection.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)]
+            scans = []
+            for detail in details:
+                match = _SQLITE_SCAN.match(detail)
+                if match:
+                    table = match.group("table")
+                    rows = connection.execute(text(f'SELECT count(*) FROM "{table}"')).scalar_one()
+                    scans.append((table, rows))
+            summary = {"plan": details}
+
+        summary["seq_scans"] = [
+            {"table": table, "rows": rows, **suggest_index(statement, table)}
+            for table, rows in scans
+            if rows >= self.seq_scan_rows
+        ]
+        summary["sampled_at"] = datetime.now().isoformat()
+        return summary
+
+    def _sample_plans_sync(self, connection: Connection, top: int) -> None:
+        for _, stats in self._top(top):
+            if stats.sample is None or not stats.statement.lstrip().upper().startswith(("SELECT", "WITH")):
+                continue
+            if "FOR UPDATE" in stats.statement.upper():
+                continue
+            statement, parameters = stats.sample
+            try:
+                # ANALYZE runs the query; the transaction is rolled back when the connection closes
+                stats.plan = self._explain(connection, statement, parameters)
+            except Exception as e:
+                connection.rollback()
+                stats.plan = {"error": f"{type(e).__name__}: {e}"}
+
+    async def sample_plans(self, top: int = 10) -> None:
+        """EXPLAIN the slowest sample of the ``top`` fingerprints by total time."""
+        if db_engine.async_mode:
+            async with db_engine.async_engine.connect() as connection:
+                await connection.run_sync(self._sample_plans_sync, top)
+        else:
+            def _run() -> None:
+                with db_engine.engine.connect() as connection:
+                    self._sample_plans_sync(connection, top)
+
+            await run_in_threadpool(_run)
+
+    def report(self, limit: int = 50) -> Dict[str, Any]:
+        queries = []
+        for key, stats in self._top(limit):
+            queries.append({
+                "fingerprint": key,
+                "statement": stats.statement,
+                "count": stats.count,
+                "total_ms": round(stats.total, 3),
+                "mean_ms": round(stats.total / stats.count, 3),
+                "max_ms": round(stats.max, 3),
+                "plan": stats.plan,
+            })
+        return {
+            "enabled": self.enabled,
+            "since": self.since.isoformat() if self.since else None,
+            "slow_ms": self.slow_ms,
+            "fingerprints": len(self._stats),
+            "overflow": self.overflow,
+            "queries": queries,
+        }
+
+
+query_profiler = QueryProfiler(
+    slow_ms=settings.DB_PROFILER_SLOW_MS,
+    max_fingerprints=settings.DB_PROFILER_MAX_FINGERPRINTS,
+    seq_scan_rows=settings.DB_PROFILER_SEQ_SCAN_ROWS,
+)
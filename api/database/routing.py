@@ -0,0 +1,188 @@
+import asyncio
+import itertools
+import time
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+from starlette.concurrency import run_in_threadpool
+
+from config import settings
+from log import get_logger
+from services.cache import build_cache
+
+log = get_logger(__name__)
+
+# Seconds the replica is behind; 0 when it has replayed everything it received
+REPLICA_LAG_QUERY = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+# Session.info keys
+USE_PRIMARY = "use_primary"
+WROTE = "wrote"
+WRITE_RECORDED = "write_recorded"
+SUBJECT = "subject"
+
+
+class Replica:
+    __slots__ = ("engine", "async_engine", "healthy", "retry_at", "lag", "reason")
+
+    def __init__(self, engine: Engine, async_engine: Optional[AsyncEngine] = None) -> None:
+        self.engine = engine
+        self.async_engine = async_engine
+        self.healthy = True
+        self.retry_at = 0.0
+        self.lag: Optional[float] = None
+        self.reason: Optional[str] = None
+
+    def mark_unhealthy(self, reason: str, retry_after: float) -> None:
+        if self.healthy:
+            log.warning("Read replica %s marked unhealthy: %s", self.name, reason)
+        self.healthy = False
+        self.reason = reason
+        self.retry_at = time.monotonic() + retry_after
+
+    def mark_healthy(self) -> None:
+        if not self.healthy:
+            log.info("Read replica %s is healthy again", self.name)
+        self.healthy = True
+        self.reason = None
+
+    @property
+    def name(self) -> str:
+        return self.engine.url.render_as_string(hide_password=True)
+
+
+class ReplicaSet:
+    """
+    Read replicas of the primary, used round-robin while healthy. A replica is taken
+    out on connection errors or when it lags more than ``max_lag`` seconds, and put
+    back by ``check`` (run periodically by ``DatabaseEngine.monitor_replicas``).
+    """
+
+    def __init__(self, replicas: Sequence[Replica], max_lag: float = 10.0, retry_after: float = 5.0) -> None:
+        self.replicas: List[Replica] = list(replicas)
+        self.max_lag = max_lag
+        self.retry_after = retry_after
+        self._next = itertools.cycle(range(len(self.replicas))) if self.replicas else None
+        for replica in self.replicas:
+            event.listen(replica.engine, "handle_error", self._on_error(replica))
+
+    def _on_error(self, replica: Replica):
+        def handle_error(context) -> None:
+            # Failed connects (no connection yet) and dropped connections; not SQL errors
+            if context.is_disconnect or context.connection is None:
+                replica.mark_unhealthy(type(context.original_exception).__name__, self.retry_after)
+
+        return handle_error
+
+    def pick(self) -> Optional[Engine]:
+        """
+        Next healthy replica, or None when all are down (reads then go to the primary).
+        An unhealthy replica gets a trial read once its ``retry_after`` has passed.
+        """
+        now = time.monotonic()
+        for _ in range(len(self.replicas)):
+            replica = self.replicas[next(self._next)]
+            if replica.healthy or now >= replica.retry_at:
+                return replica.engine
+        return None
+
+    def _check_sync(self, replica: Replica) -> float:
+        with replica.engine.connect() as connection:
+            if replica.engine.dialect.name != "postgresql":
+                connection.execute(text("SELECT 1"))
+                return 0.0
+            return float(connection.execute(REPLICA_LAG_QUERY).scalar() or 0.0)
+
+    async def _check_async(self, replica: Replica) -> float:
+        async with replica.async_engine.connect() as connection:
+            if replica.async_engine.dialect.name != "postgresql":
+                await connection.execute(text("SELECT 1"))
+                return 0.0
+            return float((await connection.execute(REPLICA_LAG_QUERY)).scalar() or 0.0)
+
+    async def check(self, timeout: float = 2.0) -> None:
+        for replica in self.replicas:
+            try:
+                if replica.async_engine is not None:
+                    lag = await asyncio.wait_for(self._check_async(replica), timeout)
+                else:
+                    lag = await asyncio.wait_for(run_in_threadpool(self._check_sync, replica), timeout)
+            except Exception as e:
+                replica.mark_unhealthy(type(e).__name__, self.retry_after)
+                continue
+
+            replica.lag = lag
+            if lag > self.max_lag:
+                replica.mark_unhealthy(f"replication lag {lag:.1f}s", self.retry_after)
+            else:
+                replica.mark_healthy()
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "replica": replica.name,
+                "healthy": replica.healthy,
+                "reason": replica.reason,
+                "lag_seconds": replica.lag,
+                "checked_out": replica.engine.pool.checkedout(),
+            }
+            for replica in self.replicas
+        ]
+
+
+class RoutingSession(Session):
+    """
+    Sends plain SELECTs to a read replica and everything else to the primary: flushes,
+    DML, SELECT ... FOR UPDATE, raw SQL, and every read of a session that has already
+    written or was asked to stay on the primary (``info["use_primary"]``).
+    """
+
+    def __init__(self, *args, replicas: Optional[ReplicaSet] = None, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._replicas = replicas
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        primary = super().get_bind(mapper, clause=clause, **kwargs)
+        if self._flushing or getattr(clause, "is_dml", False):
+            self.info[WROTE] = True
+            return primary
+        if (
+            self._replicas is None
+            or self.info.get(WROTE)
+            or self.info.get(USE_PRIMARY)
+            or not isinstance(clause, Select)
+            or clause._for_update_arg is not None
+        ):
+            return primary
+        return self._replicas.pick() or primary
+
+
+# Subjects that wrote recently, so their next reads see their own writes
+_recent_writers = build_cache(settings.DB_STICKY_BACKEND, namespace="recent-writer", max_size=100000)
+
+
+async def read_your_writes(db: Union[Session, AsyncSession], subject: str) -> None:
+    """Keep ``subject``'s session on the primary if it wrote within DB_READ_YOUR_WRITES_SECONDS."""
+    db.info[SUBJECT] = subject
+    if not db.info.get(USE_PRIMARY) and await _recent_writers.get(subject):
+        db.info[USE_PRIMARY] = True
+
+
+async def remember_write(db: Union[Session, AsyncSession]) -> None:
+    """After a write, route the same subject's reads to the primary for a while, across workers if shared."""
+    subject = db.info.get(SUBJECT)
+    if subject is None or not db.info.get(WROTE) or db.info.get(WRITE_RECORDED):
+        return
+    db.info[WRITE_RECORDED] = True
+    await _recent_writers.set(subject, True, settings.DB_READ_YOUR_WRITES_SECONDS)
+
+
+async def close_routing() -> None:
+    await _recent_writers.close()
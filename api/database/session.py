@@ -1,8 +1,18 @@
-from sqlalchemy import create_engine
+import asyncio
+import os
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from sqlalchemy import create_engine, text
 from sqlalchemy.engine import Engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from starlette.concurrency import run_in_threadpool
 
 from config import Settings, settings
+from database.routing import Replica, ReplicaSet, RoutingSession
 
 
 def build_sqlalchemy_database_url_from_settings(_settings: Settings) -> str:
@@ -12,15 +22,307 @@ def build_sqlalchemy_database_url_from_settings(_settings: Settings) -> str:
     )
 
 
-def get_engine(database_url: str, echo=False) -> Engine:
-    engine = create_engine(database_url, echo=echo)
+def build_async_sqlalchemy_database_url_from_settings(_settings: Settings) -> str:
+    return to_async_database_url(build_sqlalchemy_database_url_from_settings(_settings))
+
+
+def build_replica_urls_from_settings(_settings: Settings) -> List[str]:
+    return [url.strip() for url in _settings.DB_REPLICA_URLS.split(",") if url.strip()]
+
+
+def to_async_database_url(database_url: str) -> str:
+    return database_url.replace("postgresql://", "postgresql+asyncpg://", 1)
+
+
+def server_processes(_settings: Settings) -> int:
+    """Worker processes across all replicas, as started by server.py."""
+    if _settings.ENV in ("dev", "test"):
+        workers = 1
+    else:
+        workers = _settings.SERVER_WORKERS or os.cpu_count() or 1
+    return _settings.API_REPLICAS * workers
+
+
+def build_pool_options_from_settings(_settings: Settings) -> Dict[str, Any]:
+    pool_size, max_overflow = _settings.DB_POOL_SIZE, _settings.DB_MAX_OVERFLOW
+    if _settings.DB_MAX_CONNECTIONS:
+        # pool_size + max_overflow is what one process can open at its peak
+        share = max(1, _settings.DB_MAX_CONNECTIONS // server_processes(_settings))
+        pool_size = min(pool_size, share)
+        max_overflow = min(max_overflow, share - pool_size)
+    return {
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_recycle": _settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": _settings.DB_POOL_PRE_PING,
+        "pool_timeout": _settings.DB_POOL_TIMEOUT,
+    }
+
+
+class InstrumentedPoolMixin:
+    """Records how long callers wait for a connection checkout."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.timeouts = 0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            # Only a full pool; connect errors (server down, auth) are not waits
+            self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            self.checkouts += 1
+            self.wait_time_total += waited
+            if waited > self.wait_time_max:
+                self.wait_time_max = waited
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.checkouts = self.checkouts
+        pool.wait_time_total = self.wait_time_total
+        pool.wait_time_max = self.wait_time_max
+        pool.timeouts = self.timeouts
+        return pool
+
+
+class InstrumentedQueuePool(InstrumentedPoolMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncAdaptedQueuePool(InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def get_engine(database_url: str, echo=False, **pool_options) -> Engine:
+    engine = create_engine(database_url, echo=echo, **pool_options)
     return engine
 
 
-def get_local_session(database_url: str, echo=False, **kwargs) -> sessionmaker:
-    engine = get_engine(database_url, echo)
-    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-    return session
+def get_async_engine(database_url: str, echo=False, **pool_options) -> AsyncEngine:
+    return create_async_engine(database_url, echo=echo, **pool_options)
+
+
+class DatabaseEngine:
+    """
+    Process-wide engine registry. The engine and its connection pool are built once
+    at application startup and disposed on shutdown, instead of once per request.
+
+    With ``async_mode`` the engine is an asyncpg ``AsyncEngine`` and sessions are
+    ``AsyncSession`` objects; otherwise a psycopg2 ``Engine`` with plain sessions.
+
+    With ``replica_urls`` sessions are ``RoutingSession`` objects that read from the
+    replicas and write to the primary (see ``database.routing``).
+    """
+
+    def __init__(
+        self,
+        database_url: str,
+        echo: bool = False,
+        async_mode: bool = False,
+        async_database_url: Optional[str] = None,
+        replica_urls: Sequence[str] = (),
+        async_replica_urls: Optional[Sequence[str]] = None,
+        **pool_options,
+    ) -> None:
+        self._database_url = database_url
+        self._async_database_url = async_database_url or database_url
+        self._replica_urls = list(replica_urls)
+        self._async_replica_urls = list(async_replica_urls or [to_async_database_url(url) for url in replica_urls])
+        self._echo = echo
+        self._pool_options = pool_options
+        self.async_mode = async_mode
+        self._engine: Optional[Engine] = None
+        self._async_engine: Optional[AsyncEngine] = None
+        self._replicas: Optional[ReplicaSet] = None
+        self._sessionmaker: Optional[sessionmaker] = None
+        self._async_sessionmaker: Optional[async_sessionmaker] = None
+
+    def configure(
+        self,
+        database_url: str,
+        async_database_url: Optional[str] = None,
+        replica_urls: Sequence[str] = (),
+        async_replica_urls: Optional[Sequence[str]] = None,
+        **pool_options,
+    ) -> None:
+        """Point the registry at another database (benchmarks, scripts). Only before start()."""
+        if self._engine is not None:
+            raise RuntimeError("The database engine is already started.")
+        self._database_url = database_url
+        self._async_database_url = async_database_url or database_url
+        self._replica_urls = list(replica_urls)
+        self._async_replica_urls = list(async_replica_urls or [to_async_database_url(url) for url in replica_urls])
+        if pool_options:
+            self._pool_options = pool_options
+
+    @property
+    def replicas(self) -> Optional[ReplicaSet]:
+        return self._replicas
+
+    @property
+    def engine(self) -> Engine:
+        """The synchronous engine (the one wrapped by the async engine in async mode)."""
+        if self._engine is None:
+            self.start()
+        return self._engine
+
+    @property
+    def async_engine(self) -> AsyncEngine:
+        if not self.async_mode:
+            raise RuntimeError("The async engine is only available with DB_ASYNC enabled.")
+        if self._async_engine is None:
+            self.start()
+        return self._async_engine
+
+    def _build_replicas(self) -> Optional[ReplicaSet]:
+        if not self._replica_urls:
+            return None
+        replicas = []
+        for url, async_url in zip(self._replica_urls, self._async_replica_urls):
+            if self.async_mode:
+                async_engine = get_async_engine(
+                    async_url, self._echo, poolclass=InstrumentedAsyncAdaptedQueuePool, **self._pool_options
+                )
+                replicas.append(Replica(async_engine.sync_engine, async_engine))
+            else:
+                replicas.append(Replica(get_engine(url, self._echo, poolclass=InstrumentedQueuePool, **self._pool_options)))
+        return ReplicaSet(
+            replicas,
+            max_lag=settings.DB_REPLICA_MAX_LAG_SECONDS,
+            retry_after=settings.DB_REPLICA_CHECK_INTERVAL,
+        )
+
+    def start(self) -> None:
+        if self._engine is not None:
+            return
+
+        self._replicas = self._build_replicas()
+        # Plain sessions unless there is somewhere to route reads to
+        routing = {"replicas": self._replicas} if self._replicas else {}
+
+        if self.async_mode:
+            self._async_engine = get_async_engine(
+                self._async_database_url,
+                self._echo,
+                poolclass=InstrumentedAsyncAdaptedQueuePool,
+                **self._pool_options,
+            )
+            self._async_sessionmaker = async_sessionmaker(
+                self._async_engine,
+                autoflush=False,
+                expire_on_commit=False,
+                **({"sync_session_class": RoutingSession, **routing} if routing else {}),
+            )
+            self._engine = self._async_engine.sync_engine
+        else:
+            self._engine = get_engine(
+                self._database_url,
+                self._echo,
+                poolclass=InstrumentedQueuePool,
+                **self._pool_options,
+            )
+            self._sessionmaker = sessionmaker(
+                autocommit=False,
+                autoflush=False,
+                bind=self._engine,
+                **({"class_": RoutingSession, **routing} if routing else {}),
+            )
+
+    async def monitor_replicas(self) -> None:
+        """Re-check replica health and lag every DB_REPLICA_CHECK_INTERVAL seconds; run as a task."""
+        if self._replicas is None:
+            return
+        while True:
+            await self._replicas.check()
+            await asyncio.sleep(settings.DB_REPLICA_CHECK_INTERVAL)
+
+    async def dispose(self) -> None:
+        for replica in self._replicas.replicas if self._replicas else ():
+            if replica.async_engine is not None:
+                await replica.async_engine.dispose()
+            else:
+                replica.engine.dispose()
+        if self._async_engine is not None:
+            await self._async_engine.dispose()
+        elif self._engine is not None:
+            self._engine.dispose()
+        self._engine = None
+        self._async_engine = None
+        self._replicas = None
+        self._sessionmaker = None
+        self._async_sessionmaker = None
+
+    def _ping_sync(self) -> None:
+        with self.engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+
+    async def ping(self, timeout: float = 2.0) -> None:
+        """``SELECT 1`` through the pool; raises if no connection is usable within ``timeout``."""
+        if self.async_mode:
+            async def _ping() -> None:
+                async with self.async_engine.connect() as connection:
+                    await connection.execute(text("SELECT 1"))
+
+            await asyncio.wait_for(_ping(), timeout)
+        else:
+            await asyncio.wait_for(run_in_threadpool(self._ping_sync), timeout)
+
+    def session(self) -> Session:
+        if self.async_mode:
+            raise RuntimeError("Use async_session() when DB_ASYNC is enabled.")
+        if self._sessionmaker is None:
+            self.start()
+        return self._sessionmaker()
+
+    def async_session(self) -> AsyncSession:
+        if not self.async_mode:
+            raise RuntimeError("Use session() when DB_ASYNC is disabled.")
+        if self._async_sessionmaker is None:
+            self.start()
+        return self._async_sessionmaker()
+
+    def pool_stats(self) -> Dict[str, Any]:
+        if self._engine is None:
+            return {"started": False}
+
+        pool = self._engine.pool
+        checkouts = getattr(pool, "checkouts", 0)
+        wait_total = getattr(pool, "wait_time_total", 0.0)
+        return {
+            "started": True,
+            "async": self.async_mode,
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "max_overflow": self._pool_options.get("max_overflow"),
+            "timeout": self._pool_options.get("pool_timeout"),
+            "checkouts": checkouts,
+            "checkout_timeouts": getattr(pool, "timeouts", 0),
+            "wait_time_total_ms": round(wait_total * 1000, 3),
+            "wait_time_avg_ms": round(wait_total * 1000 / checkouts, 3) if checkouts else 0.0,
+            "wait_time_max_ms": round(getattr(pool, "wait_time_max", 0.0) * 1000, 3),
+            "replicas": self._replicas.stats() if self._replicas else [],
+        }
 
 
 SQLALCHEMY_DATABASE_URL = build_sqlalchemy_database_url_from_settings(settings)
+
+SQLALCHEMY_ASYNC_DATABASE_URL = build_async_sqlalchemy_database_url_from_settings(settings)
+
+db_engine = DatabaseEngine(
+    SQLALCHEMY_DATABASE_URL,
+    echo=settings.DB_ECHO,
+    async_mode=settings.DB_ASYNC,
+    async_database_url=SQLALCHEMY_ASYNC_DATABASE_URL,
+    replica_urls=build_replica_urls_from_settings(settings),
+    **build_pool_options_from_settings(settings),
+)
@@ -7,7 +7,8 @@ until nc -z ${DB_HOST} ${DB_PORT}; do
 done
 echo "✅ Base de datos disponible"
 
-# Ejecuta migraciones
+# Ejecuta migraciones. Con varias réplicas arrancando a la vez, alembic/env.py toma un
+# advisory lock de Postgres: la primera migra y las demás esperan y no encuentran nada pendiente
 echo "🔁 Ejecutando migraciones con Alembic..."
 alembic upgrade head
 
@@ -1,30 +1,234 @@
+import atexit
+import json
 import logging
-import sys
 import os
-from typing import Optional
-
-LOGGING_FORMATTER = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+import queue
+import random
+import sys
+import threading
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
 
 ENV_LOG_LEVELS = {
     "dev": "DEBUG",
     "prod": "INFO"
 }
 
-def get_logger(name: Optional[str] = None, level: Optional[str] = None) -> logging.Logger:
+# Read once: get_logger is called at import time by every module
+DEFAULT_LEVEL = ENV_LOG_LEVELS.get(os.getenv("ENV", "dev").lower(), "DEBUG")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+
+def _parse_sample_rates(value: str) -> Dict[str, float]:
+    rates = {}
+    for item in value.split(","):
+        name, _, rate = item.partition("=")
+        if name.strip() and rate.strip():
+            rates[name.strip()] = float(rate)
+    return rates
+
+
+# Per-logger sampling of INFO and DEBUG records, e.g. "main=0.1,database.routing=0.5"
+LOG_SAMPLE_RATES = _parse_sample_rates(os.getenv("LOG_SAMPLE_RATES", ""))
+
+REQUEST_ID_HEADER = "x-request-id"
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+# Arguments of these types are immutable, so rendering them later on the listener thread is safe
+_LAZY_ARG_TYPES = (str, int, float, bool, type(None))
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, message, request_id and exc when present."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            line["request_id"] = request_id
+        if record.exc_text:
+            line["exc"] = record.exc_text
+        return json.dumps(line, default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Enqueues records for the listener thread instead of writing them. The queue is
+    bounded: when it is full the record is dropped and counted, so a slow stdout
+    can never block the event loop.
+    """
+
+    def __init__(self, log_queue: queue.Queue) -> None:
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Read on the caller's thread, where the request context is
+        record.request_id = request_id_var.get()
+        args = record.args
+        if args and not (isinstance(args, tuple) and all(isinstance(arg, _LAZY_ARG_TYPES) for arg in args)):
+            # Mutable arguments (ORM instances, dicts) must be rendered now, not when the listener gets to them
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            # The traceback keeps whole frames alive until formatted
+            record.exc_text = _formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if _direct:
+            _stream.handle(record)
+            return
+        _ensure_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a ``rate`` fraction of records at INFO and below; warnings and errors always pass."""
+
+    def __init__(self, rate: float) -> None:
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > logging.INFO or random.random() < self.rate
+
+
+_formatter = JSONFormatter()
+_stream = logging.StreamHandler(sys.stdout)
+_stream.setFormatter(_formatter)
+_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+_handler = DroppingQueueHandler(_queue)
+_listener: Optional[QueueListener] = None
+_listener_lock = threading.Lock()
+# Set in a process that forks the workers: it writes its few records itself
+_direct = False
+_samplers: Dict[str, SamplingFilter] = {}
+
+
+def _ensure_listener() -> None:
+    global _listener
+    if _listener is not None:
+        return
+    with _listener_lock:
+        if _listener is None:
+            _listener = QueueListener(_queue, _stream, respect_handler_level=True)
+            _listener.start()
+
+
+def log_directly() -> None:
+    """
+    Write records synchronously from now on, without the listener thread. For a
+    server master that preloads the app and forks workers: it serves no requests,
+    and no thread or queue state of its own is carried into the children.
+    """
+    global _direct
+    shutdown_logging()
+    _direct = True
+
+
+def shutdown_logging() -> None:
+    """Write out whatever is still queued and stop the listener thread. Logging again restarts it."""
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def _after_fork_in_child() -> None:
+    # The listener thread does not survive fork (preloaded server workers), and the
+    # parent's queue may hold its records or a lock taken mid-put: start afresh, with
+    # the listener on first use
+    global _queue, _listener, _listener_lock, _direct
+    _queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    _handler.queue = _queue
+    _handler.dropped = 0
+    _listener = None
+    _listener_lock = threading.Lock()
+    _direct = False
+
+
+atexit.register(shutdown_logging)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def dropped_records() -> int:
+    return _handler.dropped
+
+
+def get_logger(name: Optional[str] = None, level: Optional[str] = None, sample_rate: Optional[float] = None) -> logging.Logger:
+    """
+    Logger whose records go through the shared queue. ``sample_rate`` keeps only that
+    fraction of its INFO and DEBUG records, for lines on hot paths; LOG_SAMPLE_RATES
+    sets it by logger name.
+    """
     log = logging.getLogger(name)
-    
-    # Evita múltiples handlers si ya fue configurado
-    if not log.handlers:
-        handler = logging.StreamHandler(sys.stdout)
-        formatter = logging.Formatter(LOGGING_FORMATTER)
-        handler.setFormatter(formatter)
-        log.addHandler(handler)
+    if sample_rate is None:
+        sample_rate = LOG_SAMPLE_RATES.get(log.name)
 
-    # Si no se pasa el nivel explícitamente, lo tomamos según ENV
-    if not level:
-        env = os.getenv("ENV", "dev").lower()
-        level = ENV_LOG_LEVELS.get(env, "DEBUG")
+    # Evita múltiples handlers si ya fue configurado
+    if _handler not in log.handlers:
+        log.addHandler(_handler)
+        # Si no se pasa el nivel explícitamente, lo tomamos según ENV
+        log.setLevel(level or DEFAULT_LEVEL)
+    elif level:
+        log.setLevel(level)
 
-    log.setLevel(level)
+    if sample_rate is not None:
+        sampler = _samplers.get(log.name)
+        if sampler is None:
+            sampler = _samplers[log.name] = SamplingFilter(sample_rate)
+            log.addFilter(sampler)
+        sampler.rate = sample_rate
 
     return log
+
+
+class RequestIdMiddleware:
+    """
+    Pure ASGI middleware: takes the request id from ``X-Request-ID`` or generates one,
+    exposes it to log records and echoes it in the response.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for key, value in scope["headers"]:
+            if key == REQUEST_ID_HEADER.encode():
+                request_id = value.decode("latin-1")
+                break
+        if not request_id or len(request_id) > 128 or not request_id.isprintable():
+            request_id = uuid.uuid4().hex
+        header = (REQUEST_ID_HEADER.encode(), request_id.encode("latin-1"))
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), header]
+            await send(message)
+
+        token = request_id_var.set(request_id)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id_var.reset(token)
@@ -1,14 +1,80 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from log import get_logger
+from fastapi.responses import ORJSONResponse, PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+from metrics import MetricsMiddleware, registry
+from admission import AdmissionMiddleware, admission
+from config import settings
+from database.profiler import query_profiler
+from database.routing import close_routing
+from database.session import db_engine
+from services.audit import audit_trail
+from services.idempotency import IdempotencyMiddleware, idempotency_store
+from services.security import hashing_pool
+from services.cache import principal_cache
+from services.ratelimit import rate_limiter
+from log import RequestIdMiddleware, dropped_records, get_logger, shutdown_logging
+from profiling import ProfilerMiddleware
 import routes
 
 log = get_logger(__name__)
 
-app = FastAPI(title="FastAPI Base", version="1.0.0")
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    db_engine.start()
+    log.info("Database engine started.")
+    if settings.DB_PROFILER_ENABLED:
+        query_profiler.enable()
+    replica_monitor = asyncio.create_task(db_engine.monitor_replicas())
+    audit_trail.start()
+    yield
+    replica_monitor.cancel()
+    # Before the engine goes away: the last audit records are written with it
+    await audit_trail.stop()
+    await run_in_threadpool(hashing_pool.shutdown)
+    await principal_cache.close()
+    await rate_limiter.close()
+    await idempotency_store.close()
+    await close_routing()
+    await db_engine.dispose()
+    log.info("Database engine disposed.")
+    shutdown_logging()
+
+
+app = FastAPI(title="FastAPI Base", version="1.0.0", lifespan=lifespan, default_response_class=ORJSONResponse)
 
 origins = ["http://localhost:5173"]
 
+# Innermost: profiles the app itself, inside the request id and metrics context
+if settings.REQUEST_PROFILING_ENABLED:
+    app.add_middleware(
+        ProfilerMiddleware,
+        interval=settings.REQUEST_PROFILING_INTERVAL,
+        directory=settings.REQUEST_PROFILING_DIR,
+    )
+
+# Outside the profiler, so replays never reach the app; inside the request id and metrics
+app.add_middleware(
+    IdempotencyMiddleware,
+    store=idempotency_store,
+    ttl=settings.IDEMPOTENCY_TTL,
+    lock_ttl=settings.IDEMPOTENCY_LOCK_SECONDS,
+    wait=settings.IDEMPOTENCY_WAIT_SECONDS,
+)
+
+app.add_middleware(RequestIdMiddleware)
+
+# Sheds overload before any other work; inside metrics, so 503s are counted
+app.add_middleware(AdmissionMiddleware, controller=admission)
+
+# Times the other middlewares as well
+app.add_middleware(MetricsMiddleware)
+
+# Outermost: responses made by the middlewares (shed 503s, idempotency errors and
+# replays) carry the CORS headers too, and preflights are answered before any of them
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -17,12 +83,29 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    pool = db_engine.pool_stats()
+    gauges = {
+        "db_pool_checked_out": pool.get("checked_out", 0),
+        "db_pool_overflow": pool.get("overflow", 0),
+        "db_pool_checkout_wait_seconds_max": pool.get("wait_time_max_ms", 0.0) / 1000,
+        "bcrypt_pool_pending": hashing_pool.pending,
+        "log_records_dropped": dropped_records(),
+        "audit_queue_depth": audit_trail.depth,
+        "audit_records_dropped": audit_trail.dropped,
+        **admission.gauges(),
+    }
+    return PlainTextResponse(registry.render(gauges), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/")
 def root():
-    log.info("Accessing API root endpoint.")
+    log.debug("Accessing API root endpoint.")
     return {"message": "Welcome to FastApi Base API!"}
 
 for router_name in routes.__all__:
     router = getattr(routes, router_name)
     app.include_router(router)
-    log.info(f"Router {router_name} registrado correctamente.")
+    log.info("Router %s registrado correctamente.", router_name)
@@ -0,0 +1,207 @@
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine.default import CACHE_HIT, CACHE_MISS
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class RequestStats:
+    """Per-request accumulator, the only allocation the middleware makes per request."""
+
+    __slots__ = ("db_time", "db_queries", "bcrypt_time", "bcrypt_wait", "sql_cache_hits", "sql_cache_misses")
+
+    def __init__(self) -> None:
+        self.db_time = 0.0
+        self.db_queries = 0
+        self.bcrypt_time = 0.0
+        # Time bcrypt jobs sat in the hashing pool's queue, not part of bcrypt_time
+        self.bcrypt_wait = 0.0
+        # SQLAlchemy compiled cache lookups; statements that cannot be cached count as neither
+        self.sql_cache_hits = 0
+        self.sql_cache_misses = 0
+
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def current_request_stats() -> Optional[RequestStats]:
+    return _request_stats.get()
+
+
+def record_bcrypt(seconds: float, waited: float = 0.0) -> None:
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.bcrypt_time += seconds
+        stats.bcrypt_wait += waited
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]) -> None:
+        self.buckets = buckets
+        # Last slot is +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """
+    Process-local metrics. Histograms and counters are only written from the event
+    loop thread (by the middleware, at the end of each request); DB hooks running in
+    worker threads only touch their own request's RequestStats, so nothing needs a lock.
+    """
+
+    def __init__(self) -> None:
+        self.in_flight = 0
+        self.requests: Dict[Tuple[str, str, int], int] = {}
+        self.latency: Dict[Tuple[str, str], Histogram] = {}
+        self.db_time: Dict[Tuple[str, str], Histogram] = {}
+        self.db_queries: Dict[Tuple[str, str], Histogram] = {}
+        self.bcrypt_time: Dict[Tuple[str, str], Histogram] = {}
+        self.bcrypt_wait: Dict[Tuple[str, str], Histogram] = {}
+        self.counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], int] = {}
+
+    @staticmethod
+    def _histogram(family: Dict[Tuple[str, str], Histogram], key: Tuple[str, str], buckets) -> Histogram:
+        histogram = family.get(key)
+        if histogram is None:
+            histogram = family[key] = Histogram(buckets)
+        return histogram
+
+    def observe_request(self, method: str, route: str, status: int, duration: float, stats: RequestStats) -> None:
+        key = (method, route)
+        status_key = (method, route, status)
+        self.requests[status_key] = self.requests.get(status_key, 0) + 1
+        self._histogram(self.latency, key, LATENCY_BUCKETS).observe(duration)
+        self._histogram(self.db_time, key, LATENCY_BUCKETS).observe(stats.db_time)
+        self._histogram(self.db_queries, key, QUERY_COUNT_BUCKETS).observe(stats.db_queries)
+        if stats.bcrypt_time:
+            self._histogram(self.bcrypt_time, key, LATENCY_BUCKETS).observe(stats.bcrypt_time)
+            self._histogram(self.bcrypt_wait, key, LATENCY_BUCKETS).observe(stats.bcrypt_wait)
+        if stats.sql_cache_hits:
+            self.inc("sqlalchemy_compiled_cache_total", stats.sql_cache_hits, result="hit")
+        if stats.sql_cache_misses:
+            self.inc("sqlalchemy_compiled_cache_total", stats.sql_cache_misses, result="miss")
+
+    def inc(self, name: str, amount: int = 1, **labels: str) -> None:
+        """Increment a free-form counter, e.g. ``registry.inc("rate_limited_total", scope="ip")``."""
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def render(self, extra_gauges: Optional[Dict[str, float]] = None) -> str:
+        lines: List[str] = []
+
+        lines.append("# TYPE http_requests_in_flight gauge")
+        lines.append(f"http_requests_in_flight {self.in_flight}")
+
+        lines.append("# TYPE http_requests_total counter")
+        for (method, route, status), value in sorted(self.requests.items()):
+            lines.append(f'http_requests_total{{method="{method}",route="{route}",status="{status}"}} {value}')
+
+        for name, family in (
+            ("http_request_duration_seconds", self.latency),
+            ("http_request_db_seconds", self.db_time),
+            ("http_request_db_queries", self.db_queries),
+            ("http_request_bcrypt_seconds", self.bcrypt_time),
+            ("http_request_bcrypt_wait_seconds", self.bcrypt_wait),
+        ):
+            lines.append(f"# TYPE {name} histogram")
+            for (method, route), histogram in sorted(family.items()):
+                labels = f'method="{method}",route="{route}"'
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+                lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+
+        declared = set()
+        for (name, labels), value in sorted(self.counters.items()):
+            if name not in declared:
+                lines.append(f"# TYPE {name} counter")
+                declared.add(name)
+            rendered = ",".join(f'{key}="{label}"' for key, label in labels)
+            lines.append(f"{name}{{{rendered}}} {value}" if rendered else f"{name} {value}")
+
+        for name, value in (extra_gauges or {}).items():
+            # Gauges may carry labels: 'name{label="x"}'
+            family = name.split("{", 1)[0]
+            if family not in declared:
+                lines.append(f"# TYPE {family} gauge")
+                declared.add(family)
+            lines.append(f"{name} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware: latency, status codes, in-flight, DB and bcrypt time per route."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        registry.in_flight += 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - start
+            registry.in_flight -= 1
+            _request_stats.reset(token)
+            # Route templates keep label cardinality bounded; unmatched paths share one label
+            route = scope.get("route")
+            registry.observe_request(
+                scope["method"], route.path if route is not None else "<unmatched>", status, duration, stats
+            )
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_start = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _request_stats.get()
+    if stats is None or context is None:
+        return
+    stats.db_queries += 1
+    stats.db_time += time.perf_counter() - getattr(context, "_metrics_start", time.perf_counter())
+    cache_hit = getattr(context, "cache_hit", None)
+    if cache_hit is CACHE_HIT:
+        stats.sql_cache_hits += 1
+    elif cache_hit is CACHE_MISS:
+        stats.sql_cache_misses += 1
@@ -1,5 +1,7 @@
+from models.audit import AuditLog
 from models.user import User
 
 __all__ = [
+    "AuditLog",
     "User",
-]
\ No newline at end of file
+]
@@ -0,0 +1,29 @@
+from sqlalchemy import JSON, BigInteger, Column, DateTime, Index, Integer, String
+from sqlalchemy.dialects.postgresql import JSONB
+from database.db import Base
+from datetime import datetime
+
+JSONType = JSON(none_as_null=True).with_variant(JSONB(none_as_null=True), "postgresql")
+
+
+class AuditLog(Base):
+    """One create/update/delete made through a CRUDRepository; written by ``services.audit``."""
+
+    __tablename__ = "audit_log"
+    __table_args__ = (
+        # History of one record
+        Index("ix_audit_log_entity", "entity", "entity_id"),
+        Index("ix_audit_log_created_at", "created_at"),
+    )
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    # When the change was committed
+    created_at = Column(DateTime, default=lambda: datetime.now(), nullable=False)
+    # Token subject of the caller; None for anonymous writes such as registrations
+    actor = Column(String, nullable=True)
+    action = Column(String(16), nullable=False)
+    entity = Column(String, nullable=False)
+    entity_id = Column(String, nullable=True)
+    old_values = Column(JSONType, nullable=True)
+    new_values = Column(JSONType, nullable=True)
+    request_id = Column(String(128), nullable=True)
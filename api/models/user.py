@@ -1,13 +1,51 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, DDL, Index, event, func
 from database.db import Base
 from datetime import datetime
 
 class User(Base):
     __tablename__ = "users"
+    # Masked in audit records
+    __audit_redact__ = ("hashed_password",)
+    # Left out of the principal cache; loaded from the row if an update needs it
+    __cache_exclude__ = ("hashed_password",)
+    __table_args__ = (
+        # Keyset pagination ordered by creation date
+        Index("ix_users_created_at_id", "created_at", "id"),
+        # max(updated_at) for the collection ETag without scanning the table
+        Index("ix_users_updated_at", "updated_at"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     username = Column(String, unique=True, nullable=False)
     email = Column(String, unique=True, nullable=False)
     hashed_password = Column(String, nullable=False)
+    # Bumped to revoke every token issued before (e.g. on password change)
+    token_version = Column(Integer, default=0, server_default="0", nullable=False)
     created_at = Column(DateTime, default=lambda: datetime.now(), nullable=False)
     updated_at = Column(DateTime, default=lambda: datetime.now(), onupdate=lambda: datetime.now(), nullable=False)
+
+
+# Emails are unique ignoring case; also serves the lower(email) = ... login lookup
+Index("ux_users_lower_email", func.lower(User.email), unique=True)
+# Prefix search: the "C" collation lets LIKE 'prefix%' use the index and return rows
+# in index order. PostgreSQL only, as the trigram indexes for the fuzzy search
+Index("ix_users_lower_username_prefix", func.lower(User.username).collate("C")).ddl_if(dialect="postgresql")
+Index("ix_users_lower_email_prefix", func.lower(User.email).collate("C")).ddl_if(dialect="postgresql")
+Index(
+    "ix_users_lower_username_trgm",
+    func.lower(User.username).label("lower_username"),
+    postgresql_using="gin",
+    postgresql_ops={"lower_username": "gin_trgm_ops"},
+).ddl_if(dialect="postgresql")
+Index(
+    "ix_users_lower_email_trgm",
+    func.lower(User.email).label("lower_email"),
+    postgresql_using="gin",
+    postgresql_ops={"lower_email": "gin_trgm_ops"},
+).ddl_if(dialect="postgresql")
+
+event.listen(
+    User.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
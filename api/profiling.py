@@ -0,0 +1,210 @@
+import os
+import time
+import uuid
+from typing import Dict, Optional
+from urllib.parse import parse_qs
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from database.session import db_engine
+from log import get_logger
+from metrics import current_request_stats
+from services.auth import get_current_user, get_user_roles
+
+log = get_logger(__name__)
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_MODES = ("speedscope", "store")
+
+# Functions whose frames make up each part of the breakdown (wall time, awaits included)
+BREAKDOWN_FUNCTIONS = {
+    "solve_dependencies": "deps",
+    "run_endpoint_function": "endpoint",
+    "serialize_response": "serialize",
+    "render": "serialize",
+    "dump_json": "serialize",
+    "dump_user": "serialize",
+}
+# Dependencies reported one by one inside "deps"
+DEPENDENCY_FUNCTIONS = frozenset({
+    "get_sync_db", "get_async_db", "get_current_user", "is_admin",
+    "limit_login", "limit_register",
+})
+
+
+def _requested_mode(scope) -> Optional[str]:
+    """``speedscope`` or ``store`` when the request asks to be profiled, else None."""
+    value = None
+    for key, header in scope["headers"]:
+        if key == PROFILE_HEADER:
+            value = header.decode("latin-1")
+            break
+    if value is None:
+        query = scope.get("query_string", b"")
+        if b"profile=" not in query:
+            return None
+        value = parse_qs(query.decode("latin-1")).get("profile", [""])[0]
+    value = value.strip().lower()
+    return value if value in PROFILE_MODES else "speedscope"
+
+
+async def _is_admin(scope) -> bool:
+    # The checks of the is_admin dependency, on a session of its own: the roles claim
+    # alone would outlive a revoked token (token_version) or a demoted user
+    token = None
+    for key, value in scope["headers"]:
+        if key == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() != "bearer":
+                token = None
+            break
+    if not token:
+        return False
+    try:
+        if db_engine.async_mode:
+            async with db_engine.async_session() as db:
+                user = await get_current_user(token, db)
+        else:
+            db = db_engine.session()
+            try:
+                user = await get_current_user(token, db)
+            finally:
+                await run_in_threadpool(db.close)
+    except HTTPException:
+        return False
+    return "admin" in get_user_roles(user)
+
+
+def _breakdown(root) -> Dict[str, float]:
+    """Seconds spent under the outermost frame of each BREAKDOWN_FUNCTIONS kind."""
+    totals: Dict[str, float] = {}
+    stack = [(root, frozenset())]
+    while stack:
+        frame, inside = stack.pop()
+        kind = BREAKDOWN_FUNCTIONS.get(frame.function)
+        if frame.function in DEPENDENCY_FUNCTIONS:
+            kind = f"dep_{frame.function}"
+        if kind is not None and kind not in inside:
+            totals[kind] = totals.get(kind, 0.0) + frame.time
+            inside = inside | {kind}
+        stack.extend((child, inside) for child in frame.children)
+    return totals
+
+
+def server_timing(timings: Dict[str, float]) -> bytes:
+    return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in timings.items()).encode()
+
+
+class ProfilerMiddleware:
+    """
+    Pure ASGI middleware: runs one request under pyinstrument when an admin asks with
+    ``X-Profile`` or ``?profile=`` (``speedscope`` or ``store``). Other requests only
+    pay the header lookup.
+
+    ``speedscope`` replaces the response with the speedscope JSON profile (open it in
+    https://www.speedscope.app); ``store`` returns the normal response and writes the
+    profile to ``directory``, named by the ``X-Profile-Id`` header. Both add a
+    ``Server-Timing`` header splitting the request into dependency resolution (and
+    each dependency), endpoint, serialisation, SQL, bcrypt and bcrypt queue time. SQL
+    and bcrypt run in worker threads, so they come from the request's metrics, not the
+    samples.
+
+    One request per worker is profiled at a time; others asking meanwhile run normally.
+    """
+
+    def __init__(self, app, interval: float = 0.001, directory: str = "/tmp/profiles") -> None:
+        self.app = app
+        self.interval = interval
+        self.directory = directory
+        self._busy = False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        mode = _requested_mode(scope)
+        if mode is None or self._busy or not await _is_admin(scope):
+            await self.app(scope, receive, send)
+            return
+        try:
+            from pyinstrument import Profiler
+            from pyinstrument.renderers import SpeedscopeRenderer
+        except ImportError:
+            log.warning("Request profiling asked for, but pyinstrument is not installed.")
+            await self.app(scope, receive, send)
+            return
+
+        self._busy = True
+        try:
+            await self._profile(scope, receive, send, mode, Profiler(interval=self.interval), SpeedscopeRenderer)
+        finally:
+            self._busy = False
+
+    def _timings(self, profiler, elapsed: float) -> Dict[str, float]:
+        timings = _breakdown(profiler.last_session.root_frame()) if profiler.last_session else {}
+        stats = current_request_stats()
+        if stats is not None:
+            timings["db"] = stats.db_time
+            timings["bcrypt"] = stats.bcrypt_time
+            timings["bcrypt_wait"] = stats.bcrypt_wait
+        timings["total"] = elapsed
+        return timings
+
+    async def _profile(self, scope, receive, send, mode, profiler, renderer_class):
+        # Not the request id: that comes from the client and names a file here
+        profile_id = uuid.uuid4().hex
+        start_message = None
+
+        async def send_wrapper(message):
+            nonlocal start_message
+            if mode == "speedscope":
+                # The profile is the response; the app's own is dropped
+                if message["type"] == "http.response.start":
+                    start_message = message
+                return
+            if message["type"] == "http.response.start":
+                stats = current_request_stats()
+                timings = {"db": stats.db_time, "bcrypt": stats.bcrypt_time, "bcrypt_wait": stats.bcrypt_wait} if stats is not None else {}
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (b"x-profile-id", profile_id.encode("latin-1")),
+                    (b"server-timing", server_timing(timings)),
+                ]
+            await send(message)
+
+        start = time.perf_counter()
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.stop()
+        elapsed = time.perf_counter() - start
+        timings = self._timings(profiler, elapsed)
+        profile = profiler.output(renderer_class())
+        log.info("Profiled %s %s in %.1f ms: %s", scope["method"], scope["path"], elapsed * 1000, server_timing(timings).decode())
+
+        if mode == "store":
+            await run_in_threadpool(self._store, profile_id, profile)
+            return
+
+        body = profile.encode()
+        status = start_message["status"] if start_message else 500
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"x-profiled-status", str(status).encode()),
+                (b"server-timing", server_timing(timings)),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    def _store(self, profile_id: str, profile: str) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{profile_id}.speedscope.json")
+        with open(path, "w") as f:
+            f.write(profile)
@@ -1,9 +1,11 @@
 from routes.user import router as user_router
 from routes.auth import router as auth_router
 from routes.admin import router as admin_router
+from routes.health import router as health_router
 
 __all__ = [
     "admin_router",
     "auth_router",
+    "health_router",
     "user_router"
 ]
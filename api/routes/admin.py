@@ -1,13 +1,214 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from database.db import get_db
+import asyncio
+from typing import Any, AsyncIterator, Dict, List, Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from config import settings
+from database.db import DBSession, get_db
 from models import User
+from schemas.user import USER_RESPONSE_COLUMNS, UserCreate, UserCreateHashed, UserResponse, user_row_adapter, user_rows_adapter
 from services.auth import is_admin
-from cruds import user_crud
+from services.bulk_import import iter_json_array, iter_ndjson
+from services.conditional import entity_tag, is_not_modified, not_modified, validator_headers
+from services.security import hash_password, hashing_pool
+from cruds import async_user_crud
+from cruds.user import SEARCH_FIELDS
+from database.profiler import query_profiler
+from database.session import db_engine
 
 router = APIRouter(prefix="/admin", tags=["Admin"])
 
-@router.get("/users")
-async def get_users(db: Session = Depends(get_db), _: User = Depends(is_admin)):
-    users = user_crud.get_many(db)
-    return users
+STREAM_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "json": "application/json",
+}
+
+
+@router.get("/users", response_model=List[UserResponse])
+async def get_users(
+    request: Request,
+    limit: int = Query(1000, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    order_by: Literal["id", "created_at"] = "id",
+    db: DBSession = Depends(get_db),
+    _: User = Depends(is_admin),
+):
+    """
+    One page of users in keyset order. The cursor of the next page, if any, is returned
+    in the ``X-Next-Cursor`` header. Rows are selected as plain columns and serialised
+    in one pass, without building ORM instances or response models.
+
+    The ETag covers the row count and the latest ``updated_at`` of the table, so a
+    conditional request that is still current costs one aggregate query and a 304.
+    """
+    count, last_modified = await async_user_crud.get_version(db)
+    etag = entity_tag("users", count, last_modified, limit, cursor, order_by)
+    if is_not_modified(request, etag, last_modified):
+        return not_modified(etag, last_modified)
+
+    users, next_cursor = await async_user_crud.get_page(
+        db, limit=limit, cursor=cursor, order_by=order_by, columns=USER_RESPONSE_COLUMNS
+    )
+    headers = validator_headers(etag, last_modified)
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    return Response(user_rows_adapter.dump_json(users), media_type="application/json", headers=headers)
+
+
+@router.get("/users/search", response_model=List[UserResponse])
+async def search_users(
+    q: str = Query(..., min_length=1, max_length=254),
+    mode: Literal["prefix", "fuzzy"] = "prefix",
+    field: Literal["any", "username", "email"] = "any",
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=1000),
+    db: DBSession = Depends(get_db),
+    _: User = Depends(is_admin),
+):
+    """
+    Users whose username or email (or just ``field``) start with ``q`` (``prefix``)
+    or resemble it (``fuzzy``, PostgreSQL only), ignoring case, best match first. The
+    offset of the next page, if any, is returned in the ``X-Next-Offset`` header.
+    """
+    if mode == "fuzzy" and len(q) < 3:
+        # Shorter terms have no trigram to look up, every row would be compared
+        raise HTTPException(status_code=422, detail="Fuzzy search needs at least 3 characters.")
+    fields = SEARCH_FIELDS if field == "any" else (field,)
+    users, has_more = await async_user_crud.search(
+        db, q, mode=mode, fields=fields, columns=USER_RESPONSE_COLUMNS, limit=limit, offset=offset
+    )
+    headers = {"X-Next-Offset": str(offset + limit)} if has_more else None
+    return Response(user_rows_adapter.dump_json(users), media_type="application/json", headers=headers)
+
+
+async def _serialize_users(db: DBSession, fmt: str, batch_size: int) -> AsyncIterator[bytes]:
+    first = True
+    if fmt == "json":
+        yield b"["
+
+    async for batch in async_user_crud.iter_batches(db, batch_size=batch_size, columns=USER_RESPONSE_COLUMNS):
+        if fmt == "ndjson":
+            yield b"".join(user_row_adapter.dump_json(row) + b"\n" for row in batch)
+        else:
+            # The batch as one array, minus its brackets
+            yield (b"" if first else b",") + user_rows_adapter.dump_json(batch)[1:-1]
+        first = False
+
+    if fmt == "json":
+        yield b"]"
+
+
+@router.get("/users/stream")
+async def stream_users(
+    fmt: Literal["ndjson", "json"] = Query("ndjson", alias="format"),
+    batch_size: int = Query(500, ge=1, le=10000),
+    db: DBSession = Depends(get_db),
+    _: User = Depends(is_admin),
+):
+    """Every user, serialised batch by batch so memory does not grow with the table."""
+    # The session from get_db stays open until the response has been fully sent
+    return StreamingResponse(_serialize_users(db, fmt, batch_size), media_type=STREAM_MEDIA_TYPES[fmt])
+
+
+def _validation_errors(error: ValidationError) -> List[Dict[str, Any]]:
+    # Neither the input nor the context: they can echo the record, plaintext password
+    # included. pydantic 2.3 has no include_input, so the fields are picked here.
+    return [{"type": e["type"], "loc": e["loc"], "msg": e["msg"]} for e in error.errors(include_url=False)]
+
+
+async def _prepare_user(record: Dict[str, Any], hashing_slots: asyncio.Semaphore) -> UserCreateHashed:
+    if "hashed_password" in record:
+        return UserCreateHashed.model_validate(record)
+    user_in = UserCreate.model_validate(record)
+    # Leave room in the hashing queue for interactive logins and registrations
+    async with hashing_slots:
+        hashed = await hash_password(user_in.password)
+    return UserCreateHashed(**user_in.model_dump(exclude={"password"}), hashed_password=hashed)
+
+
+@router.post("/users/import")
+async def import_users(
+    request: Request,
+    db: DBSession = Depends(get_db),
+    _: User = Depends(is_admin),
+):
+    """
+    Bulk-create users from a JSON array or an NDJSON body (``application/x-ndjson``),
+    read as a stream. Records carry either ``password`` or an already computed
+    ``hashed_password``. Rows are inserted in chunks of DB_BULK_CHUNK_SIZE; rejected
+    rows are reported by their position in the upload.
+    """
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" in content_type:
+        records = iter_ndjson(request.stream())
+    elif "json" in content_type:
+        records = iter_json_array(request.stream())
+    else:
+        raise HTTPException(status_code=415, detail="Expected application/json or application/x-ndjson.")
+
+    created = 0
+    errors: List[Dict[str, Any]] = []
+    pending: List[Dict[str, Any]] = []
+    positions: List[int] = []
+    hashing_slots = asyncio.Semaphore(hashing_pool.workers)
+
+    async def flush():
+        nonlocal created
+        prepared = await asyncio.gather(
+            *(_prepare_user(record, hashing_slots) for record in pending), return_exceptions=True
+        )
+        rows, row_positions = [], []
+        for index, item in zip(positions, prepared):
+            if isinstance(item, ValidationError):
+                errors.append({"index": index, "detail": _validation_errors(item)})
+            elif isinstance(item, Exception):
+                raise item
+            else:
+                rows.append(item)
+                row_positions.append(index)
+
+        result = await async_user_crud.bulk_create(db, rows)
+        created += result.count
+        errors.extend({"index": row_positions[e["index"]], "detail": e["detail"]} for e in result.errors)
+        pending.clear()
+        positions.clear()
+
+    index = 0
+    async for record in records:
+        pending.append(record)
+        positions.append(index)
+        index += 1
+        if len(pending) >= settings.DB_BULK_CHUNK_SIZE:
+            await flush()
+    if pending:
+        await flush()
+
+    return {"received": index, "created": created, "errors": errors}
+
+
+@router.get("/db/pool")
+async def get_pool_stats(_: User = Depends(is_admin)):
+    """Connection pool usage of this worker process."""
+    return db_engine.pool_stats()
+
+
+@router.get("/db/queries")
+async def get_slow_queries(
+    limit: int = Query(50, ge=1, le=1000),
+    explain: bool = False,
+    explain_top: int = Query(10, ge=1, le=100),
+    _: User = Depends(is_admin),
+):
+    """
+    Slow statements of this worker grouped by fingerprint (needs DB_PROFILER_ENABLED).
+    With ``explain`` the slowest sample of the ``explain_top`` fingerprints is first
+    replayed under EXPLAIN ANALYZE, which runs the query again.
+    """
+    if explain and query_profiler.enabled:
+        await query_profiler.sample_plans(explain_top)
+    return query_profiler.report(limit)
+
+
+@router.delete("/db/queries", status_code=204)
+async def reset_slow_queries(_: User = Depends(is_admin)):
+    query_profiler.reset()
@@ -0,0 +1,25 @@
+from fastapi import APIRouter
+from fastapi.responses import ORJSONResponse
+from database.session import db_engine
+from log import get_logger
+
+router = APIRouter(tags=["Health"])
+
+log = get_logger(__name__)
+
+
+@router.get("/healthz")
+async def healthz():
+    """Liveness: the process is serving requests. No I/O, so it stays cheap under load."""
+    return {"status": "ok"}
+
+
+@router.get("/readyz")
+async def readyz():
+    """Readiness: a pooled connection answers ``SELECT 1``. 503 while the database is unreachable."""
+    try:
+        await db_engine.ping()
+    except Exception as e:
+        log.warning("Readiness check failed: %s", type(e).__name__)
+        return ORJSONResponse({"status": "unavailable", "database": "error"}, status_code=503)
+    return {"status": "ready", "database": "ok"}
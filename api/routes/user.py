@@ -1,9 +1,9 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from cruds import user_crud
-from schemas.user import UserUpdate, UserResponse
-from database.db import get_db
+from fastapi import APIRouter, Depends, Request, Response
+from cruds import async_user_crud
+from schemas.user import UserUpdate, UserUpdateHashed, UserResponse, dump_user
+from database.db import DBSession, get_db
 from services.auth import get_current_user
+from services.conditional import check_if_match, is_not_modified, not_modified, user_etag, validator_headers
 from services.security import hash_password
 from models import User
 
@@ -12,36 +12,67 @@ router = APIRouter(prefix="/user", tags=["User"])
 
 @router.get("", response_model=UserResponse)
 async def get_user_profile(
-    db: Session = Depends(get_db),
+    request: Request,
+    db: DBSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    return current_user
+    """
+    Profile of the currently authenticated user. Answers If-None-Match / If-Modified-Since
+    with 304 when the client's copy is current.
+    """
+    etag = user_etag(current_user)
+    if is_not_modified(request, etag, current_user.updated_at):
+        return not_modified(etag, current_user.updated_at)
+    # UserResponse has hashed_password, which the principal cache does not keep
+    current_user = await async_user_crud.load_unloaded(db, current_user)
+    # response_model documents the shape; the body is serialised directly from the instance
+    return Response(
+        dump_user(current_user),
+        media_type="application/json",
+        headers=validator_headers(etag, current_user.updated_at),
+    )
 
 
 @router.patch("", response_model=UserResponse)
 async def update_user_profile(
+    request: Request,
     user_in: UserUpdate,
-    db: Session = Depends(get_db),
+    db: DBSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
     """
     Update the profile of the currently authenticated user. Only update fields that are provided in the request.
+    With If-Match, the update only happens if the profile still has that ETag (412 otherwise).
     """
+    precondition = None
+    if "if-match" in request.headers:
+        # Checked against the stored row, locked until the update commits, not against
+        # the principal cache: a write that lands in between gets the 412
+        def precondition(user: User) -> None:
+            check_if_match(request, user_etag(user))
+
+    user_update = UserUpdateHashed(**user_in.model_dump(exclude_unset=True, exclude={"password"}))
     if user_in.password:
-        hashed = await hash_password(user_in.password)
-        user_in = User(**user_in.dict(exclude={"password"}))
-        user_in.hashed_password = hashed
+        user_update.hashed_password = await hash_password(user_in.password)
+        # A new password revokes every token issued with the old one
+        user_update.token_version = current_user.token_version + 1
 
-    return user_crud.update(db, current_user, user_in)
+    user = await async_user_crud.update(db, current_user, user_update, precondition)
+    user = await async_user_crud.load_unloaded(db, user)
+    return Response(
+        dump_user(user),
+        media_type="application/json",
+        headers=validator_headers(user_etag(user), user.updated_at),
+    )
 
 
 @router.delete("", response_model=dict)
 async def delete_user_profile(
-    db: Session = Depends(get_db),
+    db: DBSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
     """
     Delete the profile of the currently authenticated user.
     """
-    user_crud.delete(db, current_user)
+    await async_user_crud.delete(db, current_user)
     return {"message": "User successfully deleted."}
@@ -1,5 +1,6 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional
+from pydantic import BaseModel, EmailStr, TypeAdapter
+from typing import Any, List, Optional
+from typing_extensions import TypedDict
 from datetime import datetime
 
 class UserBase(BaseModel):
@@ -17,6 +18,12 @@ class UserUpdate(BaseModel):
     email: Optional[EmailStr] = None
     password: Optional[str] = None
 
+class UserUpdateHashed(BaseModel):
+    username: Optional[str] = None
+    email: Optional[EmailStr] = None
+    hashed_password: Optional[str] = None
+    token_version: Optional[int] = None
+
 class UserResponse(UserBase):
     id: int
     hashed_password: str
@@ -25,3 +32,27 @@ class UserResponse(UserBase):
    
     class Config:
         from_attributes = True
+
+
+class UserRow(TypedDict):
+    """UserResponse as a plain row, for serialising query results without building models."""
+    id: int
+    email: str
+    username: str
+    hashed_password: str
+    created_at: datetime
+    updated_at: datetime
+
+
+# Columns to select for UserRow results
+USER_RESPONSE_COLUMNS = tuple(UserRow.__annotations__)
+
+# Built once: constructing the serializer is the expensive part, not running it
+user_response_adapter = TypeAdapter(UserResponse)
+user_row_adapter = TypeAdapter(UserRow)
+user_rows_adapter = TypeAdapter(List[UserRow])
+
+
+def dump_user(user: Any) -> bytes:
+    """JSON of a User instance (or any object with its attributes) shaped as UserResponse."""
+    return user_row_adapter.dump_json({column: getattr(user, column) for column in USER_RESPONSE_COLUMNS})
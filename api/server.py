@@ -1,11 +1,70 @@
+import os
 import uvicorn
 from config import settings
 
+DEV_ENVS = ["test", "dev"]
+
+
+def worker_config_kwargs() -> dict:
+    return {
+        "loop": settings.SERVER_LOOP,
+        "http": settings.SERVER_HTTP,
+        "limit_concurrency": settings.SERVER_LIMIT_CONCURRENCY,
+    }
+
+
+def run_production() -> None:
+    """
+    gunicorn manages the uvicorn workers. The app is imported once in the master and
+    the workers are forked from it (preload), so starting or respawning a worker does
+    not import anything again; engines, pools and caches are still created per worker
+    in the lifespan.
+    """
+    from gunicorn.app.base import BaseApplication
+    from log import log_directly
+
+    class Server(BaseApplication):
+        def load_config(self):
+            options = {
+                "bind": f"{settings.SERVER_HOST}:{settings.SERVER_PORT}",
+                "workers": settings.SERVER_WORKERS or os.cpu_count() or 1,
+                "worker_class": "server.UvicornWorker",
+                "preload_app": True,
+                "backlog": settings.SERVER_BACKLOG,
+                "keepalive": settings.SERVER_KEEPALIVE,
+                "graceful_timeout": settings.SERVER_GRACEFUL_TIMEOUT,
+                "loglevel": "info",
+            }
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from main import app
+
+            return app
+
+    # Before the app is imported: the master logs at import but never starts the log thread
+    log_directly()
+    Server().run()
+
+
+try:
+    from uvicorn.workers import UvicornWorker as _UvicornWorker
+except ImportError:  # gunicorn not installed: only the dev server is available
+    pass
+else:
+    class UvicornWorker(_UvicornWorker):
+        CONFIG_KWARGS = worker_config_kwargs()
+
+
 if __name__ == "__main__":
-    uvicorn.run(
-        "main:app",
-        host=settings.SERVER_HOST,
-        port=settings.SERVER_PORT,
-        reload=settings.ENV in ["test", "dev"],
-        log_level="debug" if settings.ENV in ["test", "dev"] else "info",
-    )
+    if settings.ENV in DEV_ENVS:
+        uvicorn.run(
+            "main:app",
+            host=settings.SERVER_HOST,
+            port=settings.SERVER_PORT,
+            reload=True,
+            log_level="debug",
+        )
+    else:
+        run_production()
@@ -0,0 +1,193 @@
+import asyncio
+import queue
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import event, insert
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from config import settings
+from database.routing import SUBJECT
+from database.session import db_engine
+from log import get_logger, request_id_var
+from metrics import registry
+from models.audit import AuditLog
+
+log = get_logger(__name__)
+
+# Session.info key holding the records of the current transaction until it commits
+PENDING = "audit_pending"
+REDACTED = "***"
+
+_JSON_TYPES = (str, int, float, bool, type(None))
+
+
+def _json_value(value: Any) -> Any:
+    if isinstance(value, _JSON_TYPES):
+        return value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (list, tuple)):
+        return [_json_value(item) for item in value]
+    return str(value)
+
+
+def audit_values(model: Any, values: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """JSON-ready copy of ``values``; columns listed in the model's ``__audit_redact__`` are masked."""
+    if values is None:
+        return None
+    redact = getattr(model, "__audit_redact__", ())
+    return {key: REDACTED if key in redact else _json_value(value) for key, value in values.items()}
+
+
+def record(
+    db: Session,
+    model: Any,
+    action: str,
+    entity_id: Any,
+    old: Optional[Dict[str, Any]] = None,
+    new: Optional[Dict[str, Any]] = None,
+) -> None:
+    """
+    Attach a change to ``db``'s transaction. It is queued for the writer when the
+    transaction commits and discarded if it rolls back; nothing is written here.
+    """
+    if not settings.AUDIT_ENABLED:
+        return
+    db.info.setdefault(PENDING, []).append({
+        "created_at": datetime.now(),
+        "actor": db.info.get(SUBJECT),
+        "action": action,
+        "entity": model.__tablename__,
+        "entity_id": None if entity_id is None else str(entity_id),
+        "old_values": audit_values(model, old),
+        "new_values": audit_values(model, new),
+        "request_id": request_id_var.get(),
+    })
+
+
+class AuditTrail:
+    """
+    Bounded in-process queue of committed changes and the task that writes them.
+
+    Records are put from whichever thread committed (threadpool or event loop) and
+    never block: past ``max_size`` they are dropped and counted. The writer runs on
+    the event loop and inserts up to ``batch_size`` rows per statement, as soon as a
+    batch is full or every ``flush_interval`` seconds, and once more on shutdown.
+    """
+
+    def __init__(self, max_size: int = 10000, batch_size: int = 500, flush_interval: float = 1.0) -> None:
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=max_size)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._signalled = False
+        self._stopping = False
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def put_many(self, records: List[Dict[str, Any]]) -> None:
+        for item in records:
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                self.dropped += 1
+        if self._loop is not None and not self._signalled and self._queue.qsize() >= self.batch_size:
+            self._signalled = True
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the writer and write out everything still queued."""
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        self._loop = None
+        await self.flush("shutdown")
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+                trigger = "size"
+            except asyncio.TimeoutError:
+                trigger = "interval"
+            if self._stopping:
+                return
+            self._wakeup.clear()
+            self._signalled = False
+            await self.flush(trigger)
+
+    def _take(self) -> List[Dict[str, Any]]:
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    async def flush(self, trigger: str = "manual") -> int:
+        written = 0
+        batch = self._take()
+        while batch:
+            if await self._write(batch):
+                written += len(batch)
+            registry.inc("audit_flushes_total", trigger=trigger)
+            batch = self._take()
+        return written
+
+    def _write_sync(self, batch: List[Dict[str, Any]]) -> None:
+        with db_engine.engine.begin() as connection:
+            connection.execute(insert(AuditLog), batch)
+
+    async def _write(self, batch: List[Dict[str, Any]]) -> bool:
+        # executemany of one INSERT; the dialect sends it as multi-row VALUES batches
+        try:
+            if db_engine.async_mode:
+                async with db_engine.async_engine.begin() as connection:
+                    await connection.execute(insert(AuditLog), batch)
+            else:
+                await run_in_threadpool(self._write_sync, batch)
+        except Exception:
+            log.exception("Could not write %d audit records", len(batch))
+            registry.inc("audit_records_total", len(batch), result="failed")
+            return False
+        registry.inc("audit_records_total", len(batch), result="written")
+        return True
+
+
+audit_trail = AuditTrail(
+    max_size=settings.AUDIT_QUEUE_SIZE,
+    batch_size=settings.AUDIT_BATCH_SIZE,
+    flush_interval=settings.AUDIT_FLUSH_INTERVAL,
+)
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session: Session) -> None:
+    # Also fired when a savepoint is released; only the outermost commit makes records final
+    if session.in_nested_transaction():
+        return
+    records = session.info.pop(PENDING, None)
+    if records:
+        audit_trail.put_many(records)
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session: Session) -> None:
+    if not session.in_nested_transaction():
+        session.info.pop(PENDING, None)
@@ -1,31 +1,64 @@
 from models import User
-from sqlalchemy.orm import Session
-from services.security import verify_password, create_access_token, decode_token
-from cruds import user_crud
+from services.security import (
+    verify_password,
+    hash_password,
+    password_needs_rehash,
+    create_access_token,
+    decode_token,
+)
+from schemas.user import UserUpdateHashed
+from services.cache import principal_cache, principal_cache_enabled, principal_version_key
+from config import settings
+from datetime import datetime, timezone
+from typing import Tuple
+from cruds import async_user_crud
 from fastapi import HTTPException, Depends
-from database.db import get_db
+from database.db import DBSession, get_db
+from database.routing import SUBJECT, read_your_writes
+from database.session import db_engine
 from log import get_logger
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import func
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
 log = get_logger(__name__)
 
-async def authenticate_user(db: Session, email: str, password: str):
-    user = user_crud.get_one(db, email=email)
+ADMIN_EMAIL = "admin@example.com"
+
+
+def get_user_roles(user: User) -> Tuple[str, ...]:
+    return ("admin",) if user.email == ADMIN_EMAIL else ()
+
+
+async def authenticate_user(db: DBSession, email: str, password: str):
+    # Emails are unique ignoring case (ux_users_lower_email), which also serves this lookup
+    user = await async_user_crud.get_one(db, func.lower(User.email) == func.lower(email))
     if not user:
         raise HTTPException(status_code=401, detail="Email not found")
     if not await verify_password(password, user.hashed_password):
         raise HTTPException(status_code=401, detail="Incorrect password")
+
+    if password_needs_rehash(user.hashed_password):
+        try:
+            hashed = await hash_password(password)
+            user = await async_user_crud.update(db, user, UserUpdateHashed(hashed_password=hashed))
+        except HTTPException:
+            log.warning("Could not rehash password for user %s", user.id)
     return user
 
-async def login_user(db: Session, email: str, password: str):
+async def login_user(db: DBSession, email: str, password: str):
     user = await authenticate_user(db, email, password)
-    return await create_access_token({"sub": user.email})
+    return await create_access_token({
+        "sub": user.email,
+        "uid": user.id,
+        "roles": list(get_user_roles(user)),
+        "ver": user.token_version,
+    })
 
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    db: DBSession = Depends(get_db)
 ):
     if not token:
         raise HTTPException(status_code=401, detail="Token not found")
@@ -34,14 +67,47 @@ async def get_current_user(
     if not payload or "sub" not in payload:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
 
-    user = user_crud.get_one(db, email=payload["sub"])
-    if not user:
-        raise HTTPException(status_code=401, detail="User not found")
+    subject = payload["sub"]
+    # Actor of the audit records this request writes
+    db.info[SUBJECT] = subject
+    if db_engine.replicas is not None:
+        await read_your_writes(db, subject)
+
+    # The user's version is read before the row: an entry loaded before a change that
+    # bumps it (services.cache.invalidate_principals) is stored under the old version
+    # and never served, even when the store lands after the invalidation
+    user_id = payload.get("uid")
+    cacheable = principal_cache_enabled and user_id is not None
+    cached = version = None
+    if cacheable:
+        cached, version = await principal_cache.get_many([subject, principal_version_key(user_id)])
+        version = version or 0
+        if cached is not None and (cached["version"] != version or cached["user"]["id"] != user_id):
+            cached = None
+
+    if cached is not None:
+        user = async_user_crud.attach_cached(db, cached["user"])
+    else:
+        user = await async_user_crud.get_one(db, email=subject)
+        if not user:
+            raise HTTPException(status_code=401, detail="User not found")
+
+    if payload.get("ver", 0) != user.token_version:
+        raise HTTPException(status_code=401, detail="Token has been revoked")
+
+    if cached is not None or not cacheable:
+        return user
+
+    ttl = settings.PRINCIPAL_CACHE_TTL
+    if "exp" in payload:
+        ttl = min(ttl, payload["exp"] - datetime.now(timezone.utc).timestamp())
+    entry = {"version": version, "user": async_user_crud.repository.dump_cached(user)}
+    await principal_cache.set(subject, entry, ttl)
 
     return user
 
 async def is_admin(user: User = Depends(get_current_user)):
     """Checks if the user has administrator permissions."""
-    if not user.email == "admin@example.com":
+    if "admin" not in get_user_roles(user):
         raise HTTPException(status_code=403, detail="You do not have permission to perform this action")
     return user
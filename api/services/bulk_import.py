@@ -0,0 +1,76 @@
+import codecs
+import json
+from typing import Any, AsyncIterator, Dict
+
+from fastapi import HTTPException
+
+_decoder = json.JSONDecoder()
+
+
+async def iter_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[Dict[str, Any]]:
+    """Records of a newline-delimited JSON body, parsed as the chunks arrive."""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield _loads(line)
+    if buffer.strip():
+        yield _loads(buffer)
+
+
+async def iter_json_array(chunks: AsyncIterator[bytes]) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Elements of a top-level JSON array of objects, decoded one at a time so the whole
+    document never has to be held in memory.
+    """
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    started = finished = False
+
+    async for chunk in chunks:
+        buffer += utf8.decode(chunk)
+        pos = 0
+        while not finished:
+            pos = _skip_separators(buffer, pos)
+            if pos == len(buffer):
+                break
+            if not started:
+                if buffer[pos] != "[":
+                    raise HTTPException(status_code=400, detail="Expected a JSON array of records.")
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == "]":
+                finished = True
+                break
+            try:
+                record, end = _decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Incomplete element, wait for the next chunk
+                break
+            if not isinstance(record, dict):
+                raise HTTPException(status_code=400, detail="Every array element must be a JSON object.")
+            pos = end
+            yield record
+        buffer = buffer[pos:]
+
+    if not finished:
+        raise HTTPException(status_code=400, detail="Malformed or truncated JSON array.")
+
+
+def _skip_separators(buffer: str, pos: int) -> int:
+    while pos < len(buffer) and (buffer[pos].isspace() or buffer[pos] == ","):
+        pos += 1
+    return pos
+
+
+def _loads(line: bytes) -> Dict[str, Any]:
+    try:
+        record = json.loads(line)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Malformed NDJSON line.")
+    if not isinstance(record, dict):
+        raise HTTPException(status_code=400, detail="Every NDJSON line must be a JSON object.")
+    return record
@@ -0,0 +1,185 @@
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Iterable, List, Optional, Sequence, Tuple
+
+from config import settings
+from log import get_logger
+
+log = get_logger(__name__)
+
+
+class CacheBackend:
+    """Minimal async key/value interface shared by the in-process and Redis caches."""
+
+    async def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        raise NotImplementedError
+
+    async def add(self, key: str, value: Any, ttl: float) -> bool:
+        """Set ``key`` only if it is absent; True when this call set it."""
+        raise NotImplementedError
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[Any]]:
+        return [await self.get(key) for key in keys]
+
+    async def incr_many(self, keys: Iterable[str], ttl: float) -> None:
+        """Add one to the integer at each of ``keys`` (missing counts as 0), resetting its TTL."""
+        raise NotImplementedError
+
+    async def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class MemoryCache(CacheBackend):
+    """
+    In-process LRU cache with per-entry TTL. Only touched from the event loop thread,
+    so it needs no locking. Entries are private to the worker process.
+    """
+
+    def __init__(self, max_size: int = 10000):
+        self._max_size = max_size
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        if ttl <= 0:
+            return
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+    async def add(self, key: str, value: Any, ttl: float) -> bool:
+        # Neither call suspends, so the check and the set are atomic on the event loop
+        if await self.get(key) is not None:
+            return False
+        await self.set(key, value, ttl)
+        return True
+
+    async def incr_many(self, keys: Iterable[str], ttl: float) -> None:
+        for key in keys:
+            await self.set(key, (await self.get(key) or 0) + 1, ttl)
+
+    async def delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+class RedisCache(CacheBackend):
+    """
+    Shared cache for multi-worker / multi-replica deployments. Values must be JSON
+    serialisable. Any ``redis.asyncio``-compatible client can be injected, e.g. a
+    fakeredis client when running without a Redis server.
+    """
+
+    def __init__(self, namespace: str, client: Any = None, url: Optional[str] = None):
+        if client is None:
+            try:
+                import redis.asyncio as redis
+            except ImportError as e:
+                raise RuntimeError("The redis cache backend requires the 'redis' package.") from e
+            if not url:
+                raise RuntimeError("REDIS_URL must be set to use the redis cache backend.")
+            client = redis.from_url(url)
+        self._client = client
+        self._prefix = f"{namespace}:"
+
+    @property
+    def client(self) -> Any:
+        return self._client
+
+    async def get(self, key: str) -> Optional[Any]:
+        raw = await self._client.get(self._prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        if ttl <= 0:
+            return
+        await self._client.set(self._prefix + key, json.dumps(value), px=int(ttl * 1000))
+
+    async def add(self, key: str, value: Any, ttl: float) -> bool:
+        return bool(await self._client.set(self._prefix + key, json.dumps(value), px=int(ttl * 1000), nx=True))
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[Any]]:
+        # One round trip
+        raws = await self._client.mget([self._prefix + key for key in keys])
+        return [json.loads(raw) if raw is not None else None for raw in raws]
+
+    async def incr_many(self, keys: Iterable[str], ttl: float) -> None:
+        async with self._client.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.incr(self._prefix + key)
+                pipe.pexpire(self._prefix + key, int(ttl * 1000))
+            await pipe.execute()
+
+    async def delete(self, key: str) -> None:
+        await self._client.delete(self._prefix + key)
+
+    async def close(self) -> None:
+        await self._client.close()
+
+
+def build_cache(backend: str, namespace: str, max_size: int = 10000) -> CacheBackend:
+    if backend == "memory":
+        if settings.API_REPLICAS > 1:
+            log.warning("The %s cache uses the memory backend with %s replicas: each one keeps its own.", namespace, settings.API_REPLICAS)
+        return MemoryCache(max_size=max_size)
+    if backend == "redis":
+        return RedisCache(namespace, url=settings.REDIS_URL)
+    raise ValueError(f"Unknown cache backend: {backend}")
+
+
+# Authenticated users keyed by token subject, see services.auth.get_current_user
+principal_cache = build_cache(
+    settings.PRINCIPAL_CACHE_BACKEND,
+    namespace="principal",
+    max_size=settings.PRINCIPAL_CACHE_SIZE,
+)
+# The in-process backend never sees the invalidations of other worker processes, so
+# it is only used when there is a single one: one replica running the dev server or
+# SERVER_WORKERS=1. Otherwise the redis backend is needed (see the README).
+principal_cache_enabled = settings.PRINCIPAL_CACHE_BACKEND != "memory" or (
+    settings.API_REPLICAS == 1
+    and (settings.ENV in ("dev", "test") or settings.SERVER_WORKERS == 1)
+)
+if not principal_cache_enabled:
+    log.warning("PRINCIPAL_CACHE_BACKEND=memory with several workers or replicas: the principal cache is disabled.")
+
+
+def principal_version_key(user_id: Any) -> str:
+    return f"version:{user_id}"
+
+
+async def invalidate_principals(user_ids: Iterable[Any]) -> None:
+    """
+    Bump the version of each user. Cached principals carry the version read before
+    their row was loaded, so one loaded before the change is never served again, even
+    if it is stored after this runs.
+    """
+    if not principal_cache_enabled:
+        return
+    # Outlives any entry stored under the previous version
+    await principal_cache.incr_many([principal_version_key(user_id) for user_id in user_ids], 2 * settings.PRINCIPAL_CACHE_TTL)
@@ -0,0 +1,76 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Dict, Optional
+
+from fastapi import HTTPException, Request, Response
+
+
+def entity_tag(*parts: Any) -> str:
+    """Strong ETag from the values that determine a representation."""
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest()
+    return f'"{digest}"'
+
+
+def user_etag(user: Any) -> str:
+    # updated_at changes on every update; token_version is there in case a write skips onupdate
+    return entity_tag("user", user.id, user.updated_at.isoformat(), user.token_version)
+
+
+def http_date(value: datetime) -> str:
+    # Naive datetimes (the models store local time) are taken as local time
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def validator_headers(etag: str, last_modified: Optional[datetime] = None) -> Dict[str, str]:
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+
+def _etag_matches(header: str, etag: str, weak: bool) -> bool:
+    if header.strip() == "*":
+        return True
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    if weak:
+        # If-None-Match uses weak comparison: W/"x" matches "x"
+        candidates = [candidate[2:] if candidate.startswith("W/") else candidate for candidate in candidates]
+    return etag in candidates
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime] = None) -> bool:
+    """
+    True when the client's copy is current: If-None-Match matches ``etag`` or, when the
+    client sent no If-None-Match, nothing changed since If-Modified-Since.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag, weak=True)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        # HTTP dates have second precision
+        return last_modified.astimezone(timezone.utc).replace(microsecond=0) <= since
+    return False
+
+
+def not_modified(etag: str, last_modified: Optional[datetime] = None) -> Response:
+    return Response(status_code=304, headers=validator_headers(etag, last_modified))
+
+
+def check_if_match(request: Request, etag: str) -> None:
+    """Optimistic concurrency: a write whose If-Match no longer matches gets a 412."""
+    if_match = request.headers.get("if-match")
+    if if_match is not None and not _etag_matches(if_match, etag, weak=False):
+        raise HTTPException(
+            status_code=412,
+            detail="The resource has been modified since it was read.",
+            headers={"ETag": etag},
+        )
@@ -0,0 +1,226 @@
+import asyncio
+import base64
+import hashlib
+import time
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+import orjson
+
+from config import settings
+from log import get_logger
+from metrics import registry
+from services.cache import CacheBackend, build_cache
+
+log = get_logger(__name__)
+
+IDEMPOTENCY_HEADER = b"idempotency-key"
+REPLAYED_HEADER = (b"idempotent-replayed", b"true")
+
+# Write routes of routes/auth.py and routes/user.py that honour Idempotency-Key.
+# Not /auth/login: replaying it would hand out a token without checking the password.
+IDEMPOTENT_ROUTES: FrozenSet[Tuple[str, str]] = frozenset({
+    ("POST", "/auth/register"),
+    ("PATCH", "/user"),
+    ("DELETE", "/user"),
+})
+
+# Answers that say "try again", not results of the request: never replayed
+RETRYABLE_STATUSES = frozenset({408, 409, 425, 429})
+# Never stored: CORS headers belong to the origin of whoever retries, and are added
+# to the replay by CORSMiddleware outside
+UNSTORED_HEADER_PREFIX = b"access-control-"
+
+IN_FLIGHT = "in_flight"
+DONE = "done"
+
+idempotency_store = build_cache(
+    settings.IDEMPOTENCY_BACKEND,
+    namespace="idempotency",
+    max_size=settings.IDEMPOTENCY_CACHE_SIZE,
+)
+
+
+def _header(scope, name: bytes) -> Optional[bytes]:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value
+    return None
+
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            break
+    return b"".join(chunks)
+
+
+async def _send_json(send, status: int, detail: str, headers: Optional[List[Tuple[bytes, bytes]]] = None) -> None:
+    body = orjson.dumps({"detail": detail})
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()), *(headers or [])],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+def _replay_receive(body: bytes, receive):
+    """``receive`` for the app once the middleware has read the body: the body, then the real channel."""
+    body_sent = False
+
+    async def receive_body():
+        nonlocal body_sent
+        if body_sent:
+            return await receive()
+        body_sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    return receive_body
+
+
+class IdempotencyMiddleware:
+    """
+    Pure ASGI middleware for ``Idempotency-Key`` on ``routes`` (method, path).
+
+    The first request with a key runs and its response (below 500 and not a
+    "retry later" status) is stored for ``ttl`` seconds; retries with the same key get it replayed, with
+    ``Idempotent-Replayed: true``, before any dependency, hashing or query runs. A
+    duplicate arriving while the first is still running waits for it instead of
+    executing again (409 after ``wait`` seconds). Keys are scoped by method, path and
+    Authorization header, and reusing one with a different body is a 422.
+
+    In-flight requests are marked in the store with ``add``, so with the redis
+    backend duplicates on other workers wait too (by polling the store).
+    """
+
+    def __init__(
+        self,
+        app,
+        store: CacheBackend,
+        routes: FrozenSet[Tuple[str, str]] = IDEMPOTENT_ROUTES,
+        ttl: float = 86400,
+        lock_ttl: float = 30,
+        wait: float = 10,
+    ) -> None:
+        self.app = app
+        self.store = store
+        self.routes = routes
+        self.ttl = ttl
+        self.lock_ttl = lock_ttl
+        self.wait = wait
+        # Requests of this worker still running, by store key
+        self._running: Dict[str, asyncio.Event] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or (scope["method"], scope["path"]) not in self.routes:
+            await self.app(scope, receive, send)
+            return
+        key = _header(scope, IDEMPOTENCY_HEADER)
+        if key is None:
+            await self.app(scope, receive, send)
+            return
+        if not key or len(key) > 255:
+            await _send_json(send, 400, "Idempotency-Key must be 1 to 255 characters long.")
+            return
+
+        scope_hash = hashlib.sha256()
+        for part in (scope["method"].encode(), scope["path"].encode(), _header(scope, b"authorization") or b"", key):
+            scope_hash.update(part + b"\0")
+        store_key = scope_hash.hexdigest()
+        body = await _read_body(receive)
+        fingerprint = hashlib.sha256(body).hexdigest()
+
+        try:
+            outcome, entry = await self._claim(store_key, fingerprint)
+        except Exception:
+            # A shared store outage must not block writes; run without idempotency
+            log.warning("Idempotency store unavailable, running the request without it")
+            outcome, entry = "bypassed", None
+        registry.inc("idempotency_requests_total", outcome=outcome)
+
+        if outcome == "replayed":
+            await self._replay(send, entry)
+        elif outcome == "mismatch":
+            await _send_json(send, 422, "Idempotency-Key was already used with a different request.")
+        elif outcome == "conflict":
+            await _send_json(send, 409, "A request with this Idempotency-Key is still in progress.", [(b"retry-after", b"1")])
+        elif outcome == "bypassed":
+            await self.app(scope, _replay_receive(body, receive), send)
+        else:
+            await self._execute(scope, receive, send, store_key, fingerprint, body)
+
+    async def _claim(self, store_key: str, fingerprint: str) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """Replay the stored response, or mark the request in flight, waiting for a running duplicate."""
+        deadline = time.monotonic() + self.wait
+        while True:
+            entry = await self.store.get(store_key)
+            if entry is not None and entry["fingerprint"] != fingerprint:
+                return "mismatch", entry
+            if entry is not None and entry["state"] == DONE:
+                return "replayed", entry
+            if entry is None and await self.store.add(store_key, {"state": IN_FLIGHT, "fingerprint": fingerprint}, self.lock_ttl):
+                return "executed", None
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return "conflict", entry
+            running = self._running.get(store_key)
+            if running is not None:
+                try:
+                    await asyncio.wait_for(running.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                # Running on another worker
+                await asyncio.sleep(min(0.05, remaining))
+
+    async def _execute(self, scope, receive, send, store_key: str, fingerprint: str, body: bytes) -> None:
+        done = self._running[store_key] = asyncio.Event()
+        status = 500
+        headers: List[Tuple[bytes, bytes]] = []
+        chunks: List[bytes] = []
+
+        async def send_wrapper(message):
+            nonlocal status, headers
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, _replay_receive(body, receive), send_wrapper)
+        finally:
+            try:
+                if status < 500 and status not in RETRYABLE_STATUSES:
+                    await self.store.set(store_key, {
+                        "state": DONE,
+                        "fingerprint": fingerprint,
+                        "status": status,
+                        "headers": [
+                            [name.decode("latin-1"), value.decode("latin-1")]
+                            for name, value in headers
+                            if not name.lower().startswith(UNSTORED_HEADER_PREFIX)
+                        ],
+                        "body": base64.b64encode(b"".join(chunks)).decode(),
+                    }, self.ttl)
+                else:
+                    # Let a retry run it again
+                    await self.store.delete(store_key)
+            except Exception:
+                log.warning("Could not store the response for an Idempotency-Key")
+            finally:
+                del self._running[store_key]
+                done.set()
+
+    @staticmethod
+    async def _replay(send, entry: Dict[str, Any]) -> None:
+        headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in entry["headers"]]
+        await send({"type": "http.response.start", "status": entry["status"], "headers": [*headers, REPLAYED_HEADER]})
+        await send({"type": "http.response.body", "body": base64.b64decode(entry["body"])})
@@ -0,0 +1,168 @@
+import time
+from collections import OrderedDict
+from typing import Any, List, Optional
+
+from fastapi import Depends, HTTPException, Request
+from fastapi.security import OAuth2PasswordRequestForm
+
+from config import settings
+from log import get_logger
+from metrics import registry
+
+log = get_logger(__name__)
+
+
+class RateLimiter:
+    """
+    Token buckets: each key holds up to ``burst`` tokens, refilled at ``rate`` tokens
+    per second. ``acquire`` takes one token and returns 0, or, when the bucket is
+    empty, the seconds until the next token.
+    """
+
+    async def acquire(self, key: str, rate: float, burst: int) -> float:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class MemoryRateLimiter(RateLimiter):
+    """
+    In-process buckets, O(1) per request. Only touched from the event loop thread, so
+    no locking; the least recently used keys are evicted past ``max_keys``. Limits are
+    per worker process.
+    """
+
+    def __init__(self, max_keys: int = 100000):
+        self._max_keys = max_keys
+        # key -> [tokens, last refill (monotonic)]
+        self._buckets: "OrderedDict[str, List[float]]" = OrderedDict()
+
+    async def acquire(self, key: str, rate: float, burst: int) -> float:
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [float(burst), now]
+            while len(self._buckets) > self._max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            bucket[0] = min(float(burst), bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            self._buckets.move_to_end(key)
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        return (1 - bucket[0]) / rate
+
+    def clear(self) -> None:
+        self._buckets.clear()
+
+
+# Refill and take in one atomic step, using the Redis clock so replicas agree on time
+_TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or burst
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000))
+return tostring(wait)
+"""
+
+
+class RedisRateLimiter(RateLimiter):
+    """
+    Buckets shared by every worker and replica, one Lua script call per request. Any
+    ``redis.asyncio``-compatible client can be injected, e.g. a fakeredis client when
+    running without a Redis server.
+    """
+
+    def __init__(self, namespace: str, client: Any = None, url: Optional[str] = None):
+        if client is None:
+            try:
+                import redis.asyncio as redis
+            except ImportError as e:
+                raise RuntimeError("The redis rate limit backend requires the 'redis' package.") from e
+            if not url:
+                raise RuntimeError("REDIS_URL must be set to use the redis rate limit backend.")
+            client = redis.from_url(url)
+        self._client = client
+        self._prefix = f"{namespace}:"
+        self._script = client.register_script(_TOKEN_BUCKET_SCRIPT)
+
+    async def acquire(self, key: str, rate: float, burst: int) -> float:
+        wait = await self._script(keys=[self._prefix + key], args=[rate, burst])
+        return float(wait)
+
+    async def close(self) -> None:
+        await self._client.close()
+
+
+def build_rate_limiter(backend: str, namespace: str, max_keys: int = 100000) -> RateLimiter:
+    if backend == "memory":
+        return MemoryRateLimiter(max_keys=max_keys)
+    if backend == "redis":
+        return RedisRateLimiter(namespace, url=settings.REDIS_URL)
+    raise ValueError(f"Unknown rate limit backend: {backend}")
+
+
+rate_limiter = build_rate_limiter(
+    settings.RATE_LIMIT_BACKEND,
+    namespace="ratelimit",
+    max_keys=settings.RATE_LIMIT_SIZE,
+)
+
+
+async def enforce(scope: str, key: str, per_minute: int, burst: int) -> None:
+    """Take a token from ``scope``'s bucket for ``key`` or reject with 429 and Retry-After."""
+    if not settings.RATE_LIMIT_ENABLED:
+        return
+    try:
+        wait = await rate_limiter.acquire(f"{scope}:{key}", per_minute / 60, burst)
+    except Exception:
+        # A shared store outage must not lock everyone out
+        log.warning("Rate limiter unavailable, letting %s request through", scope)
+        return
+    if wait > 0:
+        registry.inc("rate_limited_total", scope=scope)
+        raise HTTPException(
+            status_code=429,
+            detail="Too many requests, please try again later.",
+            headers={"Retry-After": str(max(1, round(wait + 0.5)))},
+        )
+
+
+def client_ip(request: Request) -> str:
+    # Behind a proxy this is the real client only if uvicorn trusts it (FORWARDED_ALLOW_IPS)
+    return request.client.host if request.client else "unknown"
+
+
+async def limit_login(request: Request, form_data: OAuth2PasswordRequestForm = Depends()) -> None:
+    """Per-IP and per-account buckets, checked before the user lookup and bcrypt verification."""
+    await enforce(
+        "login_ip", client_ip(request),
+        settings.RATE_LIMIT_LOGIN_IP_PER_MINUTE, settings.RATE_LIMIT_LOGIN_IP_BURST,
+    )
+    await enforce(
+        "login_account", form_data.username.strip().lower(),
+        settings.RATE_LIMIT_LOGIN_ACCOUNT_PER_MINUTE, settings.RATE_LIMIT_LOGIN_ACCOUNT_BURST,
+    )
+
+
+async def limit_register(request: Request) -> None:
+    """Per-IP bucket, checked before the password is hashed."""
+    await enforce(
+        "register_ip", client_ip(request),
+        settings.RATE_LIMIT_REGISTER_IP_PER_MINUTE, settings.RATE_LIMIT_REGISTER_IP_BURST,
+    )
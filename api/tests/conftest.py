@@ -0,0 +1,73 @@
+import os
+
+# Settings are read when config is first imported: required values for the tests,
+# a cheap bcrypt cost and no rate limits. Anything already in the environment wins.
+for key, value in {
+    "ENV": "test",
+    "SERVER_HOST": "127.0.0.1",
+    "SERVER_PORT": "3000",
+    "DB_USER": "test",
+    "DB_PASSWORD": "test",
+    "DB_HOST": "localhost",
+    "DB_PORT": "5432",
+    "DB_NAME": "test",
+    "JWT_SECRET_KEY": "test-secret-key-of-at-least-32-bytes",
+    "JWT_ALGORITHM": "HS256",
+    "JWT_ACCESS_TOKEN_EXPIRE_MINUTES": "60",
+    "BCRYPT_ROUNDS": "4",
+    "RATE_LIMIT_ENABLED": "false",
+}.items():
+    os.environ.setdefault(key, value)
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+
+import models  # noqa: F401  registers the tables
+from database.db import Base
+from database.session import db_engine
+from services.cache import principal_cache
+from services.idempotency import idempotency_store
+
+ADMIN = {"email": "admin@example.com", "username": "admin", "password": "admin-pw"}
+
+
+@pytest.fixture
+def database_url(tmp_path):
+    """A fresh SQLite file per test, with the schema of the models."""
+    url = f"sqlite:///{tmp_path / 'test.db'}"
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    engine.dispose()
+    db_engine.configure(url, url.replace("sqlite://", "sqlite+aiosqlite://", 1))
+    return url
+
+
+@pytest.fixture
+def client(database_url):
+    from main import app
+
+    # In-process stores outlive the app's lifespan; start every test from empty ones
+    for store in (principal_cache, idempotency_store):
+        if hasattr(store, "clear"):
+            store.clear()
+    with TestClient(app) as client:
+        yield client
+
+
+def register(client, email, username, password="pw"):
+    response = client.post("/auth/register", json={"email": email, "username": username, "password": password})
+    assert response.status_code == 200, response.text
+    return response
+
+
+def login(client, email, password="pw"):
+    response = client.post("/auth/login", data={"username": email, "password": password})
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture
+def admin_headers(client):
+    register(client, ADMIN["email"], ADMIN["username"], ADMIN["password"])
+    return login(client, ADMIN["email"], ADMIN["password"])
@@ -0,0 +1,136 @@
+import asyncio
+
+import pytest
+
+from admission import ROUTE_CLASSES, AdmissionController, AIMDLimiter, RouteClass, admission, classify
+
+ORIGIN = {"Origin": "http://localhost:5173"}
+
+
+def small_class(**overrides):
+    values = dict(name="test", priority=0, target_latency=0.05, initial_limit=2, min_limit=1, max_limit=4, max_queue=1, max_wait=0.2)
+    return RouteClass(**{**values, **overrides})
+
+
+def test_classify():
+    assert classify("POST", "/auth/login").name == "auth"
+    assert classify("GET", "/admin/users").name == "admin"
+    assert classify("GET", "/user").name == "cheap"
+    assert classify("PATCH", "/user").name == "default"
+
+
+def test_requests_past_the_limit_queue_then_shed():
+    async def run():
+        limiter = AIMDLimiter(small_class())
+        assert await limiter.acquire() is None
+        assert await limiter.acquire() is None
+        queued = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        assert limiter.queued == 1
+        # max_queue is 1
+        assert await limiter.acquire() == "queue_full"
+
+        limiter.release(0.01)
+        assert await queued is None
+        assert limiter.in_flight == 2
+        return limiter
+
+    asyncio.run(run())
+
+
+def test_queued_request_times_out():
+    async def run():
+        limiter = AIMDLimiter(small_class(initial_limit=1, max_wait=0.05))
+        await limiter.acquire()
+        return await limiter.acquire(), limiter
+
+    reason, limiter = asyncio.run(run())
+    assert reason == "timeout"
+    assert limiter.queued == 0
+    assert limiter.in_flight == 1
+
+
+def test_cancelled_waiter_gives_no_slot_away():
+    async def run():
+        limiter = AIMDLimiter(small_class(initial_limit=1))
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        limiter.release(0.01)
+        return limiter
+
+    limiter = asyncio.run(run())
+    assert limiter.in_flight == 0
+    assert limiter.queued == 0
+
+
+def test_limit_adapts_to_latency():
+    limiter = AIMDLimiter(small_class(initial_limit=4, max_limit=8), backoff=0.5)
+    limiter.in_flight = 4
+    limiter.release(1.0)
+    assert limiter.limit == 2.0
+    # At most one decrease per target_latency
+    limiter.in_flight = 1
+    limiter.release(1.0)
+    assert limiter.limit == 2.0
+
+    # Fast responses while the limit is in use grow it by about one per round
+    limiter.in_flight = 2
+    limiter.release(0.01)
+    assert limiter.limit == 2.5
+
+
+def test_limit_stays_within_bounds():
+    limiter = AIMDLimiter(small_class(initial_limit=1, min_limit=1), backoff=0.1)
+    limiter.in_flight = 1
+    limiter.release(1.0)
+    assert limiter.limit == 1.0
+
+    limiter = AIMDLimiter(small_class(initial_limit=4, max_limit=4))
+    limiter.in_flight = 4
+    limiter.release(0.01)
+    assert limiter.limit == 4.0
+
+
+def test_overload_backs_off_less_important_classes():
+    controller = AdmissionController()
+    limits = {name: limiter.limit for name, limiter in controller.limiters.items()}
+    cheap = controller.limiters["cheap"]
+    cheap.in_flight = 1
+
+    controller.release(cheap, ROUTE_CLASSES["cheap"].target_latency * 10)
+
+    for name, limiter in controller.limiters.items():
+        assert limiter.limit < limits[name]
+
+    # A slow admin request leaves the classes above it alone
+    controller = AdmissionController()
+    admin_limiter = controller.limiters["admin"]
+    admin_limiter.in_flight = 1
+    controller.release(admin_limiter, ROUTE_CLASSES["admin"].target_latency * 10)
+    assert controller.limiters["cheap"].limit == ROUTE_CLASSES["cheap"].initial_limit
+
+
+def test_shed_request_gets_503_with_cors(client, monkeypatch):
+    limiter = admission.limiters["cheap"]
+
+    async def full():
+        return "queue_full"
+
+    monkeypatch.setattr(limiter, "acquire", full)
+    response = client.get("/user", headers=ORIGIN)
+
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+    assert response.headers["access-control-allow-origin"] == ORIGIN["Origin"]
+    # Probes are never shed
+    assert client.get("/healthz").status_code == 200
+
+
+def test_admitted_requests_release_their_slot(client, admin_headers):
+    for _ in range(3):
+        assert client.get("/admin/users", headers=admin_headers).status_code == 200
+    assert all(limiter.in_flight == 0 for limiter in admission.limiters.values())
@@ -0,0 +1,75 @@
+import asyncio
+import json
+
+from benchmarks import load, micro
+from benchmarks.common import BenchResult, compare_with_baseline, measure, percentile
+
+SUMMARY_KEYS = {"n", "p50_ms", "p95_ms", "p99_ms", "rps"}
+
+
+def test_percentile_is_nearest_rank():
+    values = [float(i) for i in range(1, 101)]
+    assert percentile(values, 50) == 50.0
+    assert percentile(values, 95) == 95.0
+    assert percentile(values, 99) == 99.0
+    assert percentile([0.5], 99) == 0.5
+    assert percentile([], 50) == 0.0
+
+
+def test_summary():
+    result = BenchResult("x", latencies=[0.001, 0.003, 0.002, 0.004], wall_time=0.5, db_queries_per_request=1.0)
+    assert result.summary() == {
+        "n": 4, "p50_ms": 2.0, "p95_ms": 4.0, "p99_ms": 4.0, "rps": 8.0, "db_queries_per_request": 1.0,
+    }
+
+
+def test_measure_runs_every_iteration_within_the_concurrency():
+    calls, in_flight, peak = [], 0, 0
+
+    async def call(i):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0)
+        calls.append(i)
+        in_flight -= 1
+
+    result = asyncio.run(measure("x", call, iterations=20, concurrency=4))
+    assert sorted(calls) == list(range(20))
+    assert len(result.latencies) == 20
+    assert peak == 4
+
+
+def test_compare_with_baseline(tmp_path):
+    baseline = tmp_path / "baseline.json"
+    baseline.write_text(json.dumps({
+        "fast": {"p95_ms": 10.0, "rps": 100.0, "db_queries_per_request": 1.0},
+        "steady": {"p95_ms": 10.0, "rps": 100.0},
+    }))
+    results = {
+        "fast": {"p95_ms": 13.0, "rps": 70.0, "db_queries_per_request": 2.0},
+        "steady": {"p95_ms": 11.0, "rps": 90.0},
+        "new": {"p95_ms": 1000.0, "rps": 1.0},
+    }
+
+    regressions = compare_with_baseline(results, str(baseline), tolerance=0.2)
+
+    assert len(regressions) == 3
+    assert all(regression.startswith("fast:") for regression in regressions)
+    assert compare_with_baseline(results, str(baseline), tolerance=0.5) == ["fast: DB queries/request 1.0 -> 2.0"]
+
+
+def test_suites_run_against_the_app(client):
+    from main import app
+
+    async def run():
+        return await micro.run(3) + await load.run(app, requests=6, concurrency=2, admin_rows=20)
+
+    results = client.portal.call(run)
+    assert {"security.hash_password", "load.GET /user"} <= {result.name for result in results}
+    for result in results:
+        assert SUMMARY_KEYS <= set(result.summary())
+        assert result.summary()["n"] > 0
+    # Per-request query counts come from the metrics middleware
+    profile_reads = next(result for result in results if result.name == "load.GET /user")
+    assert profile_reads.db_queries_per_request is not None
@@ -0,0 +1,110 @@
+import json
+
+import pytest
+from sqlalchemy.exc import DataError, OperationalError
+from sqlalchemy.orm import Session
+
+from config import settings
+from tests.conftest import login, register
+
+
+def record(name, **extra):
+    return {"email": f"{name}@example.com", "username": name, "password": f"{name}-secret", **extra}
+
+
+def usernames(client, headers, prefix):
+    response = client.get("/admin/users/search", headers=headers, params={"q": prefix, "limit": 100})
+    return sorted(user["username"] for user in response.json())
+
+
+def test_import_reports_rejected_rows_by_position(client, admin_headers):
+    records = [
+        record("bulk1"),
+        {"email": "bulk2@example.com", "username": "bulk2", "hashed_password": "$2b$04$" + "x" * 53},
+        record("bulk3", email="not-an-email"),
+        record("bulk4", email="bulk1@example.com"),
+        record("bulk5"),
+    ]
+    response = client.post("/admin/users/import", headers=admin_headers, json=records)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["received"] == 5
+    assert body["created"] == 3
+    assert [error["index"] for error in body["errors"]] == [2, 3]
+    assert usernames(client, admin_headers, "bulk") == ["bulk1", "bulk2", "bulk5"]
+
+
+def test_validation_errors_do_not_echo_the_record(client, admin_headers):
+    records = [record("leak", email="not-an-email"), {"username": 5, "password": "plain-secret"}]
+    response = client.post("/admin/users/import", headers=admin_headers, json=records)
+
+    assert response.status_code == 200
+    assert "secret" not in response.text
+    for error in response.json()["errors"]:
+        for detail in error["detail"]:
+            assert set(detail) == {"type", "loc", "msg"}
+
+
+def test_ndjson_upload_in_several_chunks(client, admin_headers, monkeypatch):
+    monkeypatch.setattr(settings, "DB_BULK_CHUNK_SIZE", 2)
+    lines = [record(f"nd{i}") for i in range(5)]
+    # Duplicate in the last chunk: the chunks before it stay committed
+    lines.append(record("nd9", username="nd0"))
+    body = "\n".join(json.dumps(line) for line in lines) + "\n"
+
+    response = client.post(
+        "/admin/users/import",
+        headers={**admin_headers, "Content-Type": "application/x-ndjson"},
+        content=body,
+    )
+
+    assert response.status_code == 200
+    assert response.json()["created"] == 5
+    assert [error["index"] for error in response.json()["errors"]] == [5]
+    assert usernames(client, admin_headers, "nd") == [f"nd{i}" for i in range(5)]
+
+
+def test_rows_the_database_rejects_are_reported(client, admin_headers, monkeypatch):
+    original = Session.scalars
+
+    def scalars(self, statement, params=None, **kwargs):
+        if isinstance(params, list) and any(row.get("username") == "too-long" for row in params):
+            raise DataError("INSERT", {}, Exception("value too long"))
+        return original(self, statement, params, **kwargs)
+
+    monkeypatch.setattr(Session, "scalars", scalars)
+    records = [record("ok1"), record("too-long"), record("ok2")]
+    response = client.post("/admin/users/import", headers=admin_headers, json=records)
+
+    assert response.status_code == 200
+    assert response.json()["created"] == 2
+    assert response.json()["errors"] == [{"index": 1, "detail": "Invalid values for this record."}]
+
+
+def test_lost_connection_during_replay_is_a_server_error(client, admin_headers, monkeypatch):
+    original = Session.scalars
+
+    def scalars(self, statement, params=None, **kwargs):
+        if isinstance(params, list) and any(row.get("username") == "bad" for row in params):
+            raise DataError("INSERT", {}, Exception("value too long"))
+        if isinstance(params, list) and len(params) == 1 and params[0].get("username") == "dead":
+            raise OperationalError("INSERT", {}, Exception("server closed the connection"), connection_invalidated=True)
+        return original(self, statement, params, **kwargs)
+
+    monkeypatch.setattr(Session, "scalars", scalars)
+    response = client.post("/admin/users/import", headers=admin_headers, json=[record("ok1"), record("bad"), record("dead")])
+
+    assert response.status_code == 500
+    assert response.json()["detail"] == "Unexpected error while creating the records."
+
+
+def test_unsupported_content_type(client, admin_headers):
+    response = client.post("/admin/users/import", headers={**admin_headers, "Content-Type": "text/csv"}, content="a,b")
+    assert response.status_code == 415
+
+
+def test_import_needs_an_admin(client):
+    register(client, "user@example.com", "user")
+    response = client.post("/admin/users/import", headers=login(client, "user@example.com"), json=[record("x")])
+    assert response.status_code == 403
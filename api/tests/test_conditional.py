@@ -0,0 +1,96 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import text
+
+from cruds import user_crud
+from database.session import db_engine
+from schemas.user import UserUpdateHashed
+from tests.conftest import login, register
+
+
+def test_conditional_get_of_the_profile(client):
+    register(client, "a@example.com", "a")
+    headers = login(client, "a@example.com")
+    response = client.get("/user", headers=headers)
+    etag, last_modified = response.headers["etag"], response.headers["last-modified"]
+
+    not_modified = client.get("/user", headers={**headers, "If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+    assert not_modified.headers["etag"] == etag
+    assert client.get("/user", headers={**headers, "If-None-Match": "W/" + etag}).status_code == 304
+    assert client.get("/user", headers={**headers, "If-Modified-Since": last_modified}).status_code == 304
+    assert client.get("/user", headers={**headers, "If-Modified-Since": "Mon, 01 Jan 2001 00:00:00 GMT"}).status_code == 200
+
+
+def test_if_match_on_update(client):
+    register(client, "a@example.com", "a")
+    headers = login(client, "a@example.com")
+    etag = client.get("/user", headers=headers).headers["etag"]
+
+    mismatch = client.patch("/user", headers={**headers, "If-Match": '"other"'}, json={"username": "b"})
+    assert mismatch.status_code == 412
+    assert mismatch.headers["etag"] == etag
+
+    updated = client.patch("/user", headers={**headers, "If-Match": etag}, json={"username": "b"})
+    assert updated.status_code == 200
+    assert updated.headers["etag"] != etag
+
+    # The first ETag is stale now
+    assert client.patch("/user", headers={**headers, "If-Match": etag}, json={"username": "c"}).status_code == 412
+    assert client.get("/user", headers=headers).json()["username"] == "b"
+
+
+def test_if_match_is_checked_against_the_stored_row(client):
+    register(client, "a@example.com", "a")
+    headers = login(client, "a@example.com")
+    etag = client.get("/user", headers=headers).headers["etag"]
+
+    # A write the principal cache does not hear about: the cached user still has this ETag
+    with db_engine.engine.begin() as connection:
+        connection.execute(text("UPDATE users SET updated_at = :at"), {"at": datetime.now() + timedelta(seconds=1)})
+    assert client.get("/user", headers={**headers, "If-None-Match": etag}).status_code == 304
+
+    response = client.patch("/user", headers={**headers, "If-Match": etag}, json={"username": "b"})
+    assert response.status_code == 412
+    assert client.get("/user", headers=headers).json()["username"] == "a"
+
+
+def test_conditional_get_of_the_collection(client, admin_headers):
+    register(client, "b@example.com", "b")
+    response = client.get("/admin/users?limit=1", headers=admin_headers)
+    etag = response.headers["etag"]
+    assert response.headers["x-next-cursor"]
+
+    assert client.get("/admin/users?limit=1", headers={**admin_headers, "If-None-Match": etag}).status_code == 304
+    # The ETag covers the page parameters
+    assert client.get("/admin/users?limit=2", headers={**admin_headers, "If-None-Match": etag}).status_code == 200
+
+    register(client, "c@example.com", "c")
+    assert client.get("/admin/users?limit=1", headers={**admin_headers, "If-None-Match": etag}).status_code == 200
+
+
+def test_failed_precondition_leaves_the_row_unchanged(client):
+    register(client, "a@example.com", "a")
+    seen = []
+
+    def precondition(user):
+        seen.append(user.username)
+        raise HTTPException(status_code=412)
+
+    db = db_engine.session()
+    try:
+        user = user_crud.get_one(db, email="a@example.com")
+        with db_engine.engine.begin() as connection:
+            connection.execute(text("UPDATE users SET username = 'changed'"))
+        with pytest.raises(HTTPException):
+            user_crud.update(db, user, UserUpdateHashed(username="b"), precondition)
+    finally:
+        db.close()
+
+    # The precondition saw the stored row, not the instance loaded earlier
+    assert seen == ["changed"]
+    with db_engine.engine.connect() as connection:
+        assert connection.execute(text("SELECT username FROM users")).scalar_one() == "changed"
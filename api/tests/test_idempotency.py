@@ -0,0 +1,186 @@
+import asyncio
+import threading
+
+import fakeredis.aioredis
+import pytest
+
+from services.cache import MemoryCache, RedisCache
+from services.idempotency import IdempotencyMiddleware
+from tests.conftest import login, register
+
+ORIGIN = {"Origin": "http://localhost:5173"}
+NEW_USER = {"email": "idem@example.com", "username": "idem", "password": "pw"}
+
+
+def test_retried_registration_is_replayed(client, admin_headers):
+    key = {"Idempotency-Key": "register-1"}
+    first = client.post("/auth/register", json=NEW_USER, headers=key)
+    retry = client.post("/auth/register", json=NEW_USER, headers=key)
+
+    assert first.status_code == 200
+    assert retry.status_code == 200
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert retry.content == first.content
+    # Without the key the same body is a duplicate registration
+    assert client.post("/auth/register", json=NEW_USER).status_code == 400
+    users = client.get("/admin/users/search", headers=admin_headers, params={"q": "idem"}).json()
+    assert len(users) == 1
+
+
+def test_key_reused_with_another_body(client):
+    key = {"Idempotency-Key": "register-1"}
+    client.post("/auth/register", json=NEW_USER, headers=key)
+    response = client.post("/auth/register", json={**NEW_USER, "username": "other"}, headers=key)
+    assert response.status_code == 422
+
+
+def test_concurrent_duplicates_run_once(client):
+    responses = []
+
+    def send():
+        responses.append(client.post("/auth/register", json=NEW_USER, headers={"Idempotency-Key": "register-2"}))
+
+    threads = [threading.Thread(target=send) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert [response.status_code for response in responses] == [200] * 5
+    assert sum(response.headers.get("idempotent-replayed") == "true" for response in responses) == 4
+
+
+def test_keys_are_scoped_by_caller(client):
+    register(client, "a@example.com", "a")
+    register(client, "b@example.com", "b")
+    key = {"Idempotency-Key": "same"}
+    a = client.patch("/user", headers={**login(client, "a@example.com"), **key}, json={"username": "a2"})
+    # Another body under the same key: a 422 if the key were not the caller's own
+    b = client.patch("/user", headers={**login(client, "b@example.com"), **key}, json={"username": "b2"})
+
+    assert a.json()["username"] == "a2"
+    assert b.status_code == 200
+    assert b.json()["username"] == "b2"
+    assert "idempotent-replayed" not in b.headers
+
+
+def test_replay_does_not_carry_the_first_origin(client):
+    register(client, "a@example.com", "a")
+    headers = {**login(client, "a@example.com"), "Idempotency-Key": "patch-1"}
+    first = client.patch("/user", headers={**headers, **ORIGIN}, json={"username": "b"})
+    retry = client.patch("/user", headers=headers, json={"username": "b"})
+
+    assert first.headers["access-control-allow-origin"] == ORIGIN["Origin"]
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert retry.headers["etag"] == first.headers["etag"]
+    assert "access-control-allow-origin" not in retry.headers
+
+
+def test_invalid_key(client):
+    response = client.post("/auth/register", json=NEW_USER, headers={"Idempotency-Key": "k" * 256})
+    assert response.status_code == 400
+
+
+# The middleware alone, as separate workers sharing one store
+
+
+def make_app(status=200, started=None, release=None):
+    calls = []
+
+    async def app(scope, receive, send):
+        message = await receive()
+        calls.append(message["body"])
+        if started is not None:
+            started.set()
+            await release.wait()
+        await send({"type": "http.response.start", "status": status, "headers": [(b"content-type", b"text/plain")]})
+        await send({"type": "http.response.body", "body": b"done %d" % len(calls)})
+
+    return app, calls
+
+
+async def call(middleware, key=b"k", body=b"{}"):
+    scope = {"type": "http", "method": "PATCH", "path": "/user", "headers": [(b"idempotency-key", key)]}
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    await middleware(scope, receive, send)
+    headers = dict(sent[0]["headers"])
+    return sent[0]["status"], headers, sent[1]["body"]
+
+
+@pytest.fixture(params=["memory", "redis"])
+def store(request):
+    if request.param == "memory":
+        return MemoryCache()
+    return RedisCache("idempotency-test", client=fakeredis.aioredis.FakeRedis())
+
+
+def test_workers_share_stored_responses(store):
+    app, calls = make_app()
+    worker_a = IdempotencyMiddleware(app, store)
+    worker_b = IdempotencyMiddleware(app, store)
+
+    async def run():
+        return await call(worker_a), await call(worker_b)
+
+    first, retry = asyncio.run(run())
+    assert calls == [b"{}"]
+    assert retry[0] == 200
+    assert retry[1][b"idempotent-replayed"] == b"true"
+    assert retry[2] == first[2]
+
+
+def test_duplicate_on_another_worker_waits_for_the_first(store):
+    async def run():
+        started, release = asyncio.Event(), asyncio.Event()
+        app, calls = make_app(started=started, release=release)
+        worker_a = IdempotencyMiddleware(app, store)
+        worker_b = IdempotencyMiddleware(app, store, wait=5)
+
+        first = asyncio.create_task(call(worker_a))
+        await started.wait()
+        duplicate = asyncio.create_task(call(worker_b))
+        await asyncio.sleep(0.1)
+        release.set()
+        return await first, await duplicate, calls
+
+    first, duplicate, calls = asyncio.run(run())
+    assert len(calls) == 1
+    assert duplicate[1][b"idempotent-replayed"] == b"true"
+    assert duplicate[2] == first[2]
+
+
+def test_duplicate_gives_up_after_wait(store):
+    async def run():
+        started, release = asyncio.Event(), asyncio.Event()
+        app, _ = make_app(started=started, release=release)
+        first = asyncio.create_task(call(IdempotencyMiddleware(app, store)))
+        await started.wait()
+        duplicate = await call(IdempotencyMiddleware(app, store, wait=0.1))
+        release.set()
+        await first
+        return duplicate
+
+    status, headers, _ = asyncio.run(run())
+    assert status == 409
+    assert headers[b"retry-after"] == b"1"
+
+
+def test_server_errors_are_not_stored(store):
+    app, calls = make_app(status=503)
+    middleware = IdempotencyMiddleware(app, store)
+
+    async def run():
+        await call(middleware)
+        return await call(middleware)
+
+    status, headers, _ = asyncio.run(run())
+    assert status == 503
+    assert b"idempotent-replayed" not in headers
+    assert len(calls) == 2
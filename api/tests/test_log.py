@@ -0,0 +1,65 @@
+import logging
+import os
+import queue
+
+import pytest
+
+import log
+
+
+@pytest.fixture
+def records(monkeypatch):
+    """Records reaching the output stream, written synchronously."""
+    seen = []
+    monkeypatch.setattr(log, "_direct", True)
+    monkeypatch.setattr(log._stream, "handle", seen.append)
+    return seen
+
+
+def test_sampling_keeps_warnings(records):
+    logger = log.get_logger("tests.sampled", sample_rate=0.0)
+    logger.info("dropped")
+    logger.warning("kept")
+    assert [record.getMessage() for record in records] == ["kept"]
+
+
+def test_sample_rates_by_logger_name(records, monkeypatch):
+    monkeypatch.setitem(log.LOG_SAMPLE_RATES, "tests.configured", 0.0)
+    log.get_logger("tests.configured").info("dropped")
+    log.get_logger("tests.other").info("kept")
+    assert [record.getMessage() for record in records] == ["kept"]
+
+
+def test_parse_sample_rates():
+    assert log._parse_sample_rates("main=0.1, database.routing = 0.5,") == {"main": 0.1, "database.routing": 0.5}
+    assert log._parse_sample_rates("") == {}
+
+
+def test_direct_output_starts_no_listener(records):
+    log.shutdown_logging()
+    log.get_logger("tests.direct").info("written %s", "now")
+    assert log._listener is None
+    assert records[0].getMessage() == "written now"
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_forked_child_starts_from_a_fresh_queue():
+    parent_queue = log._queue
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        ok = log._queue is not parent_queue and log._handler.queue is log._queue and log._listener is None
+        os.write(write_fd, b"1" if ok else b"0")
+        os._exit(0)
+    os.waitpid(pid, 0)
+    assert os.read(read_fd, 1) == b"1"
+    assert log._queue is parent_queue
+
+
+def test_mutable_arguments_are_rendered_when_logged():
+    handler = log.DroppingQueueHandler(queue.Queue())
+    values = {"a": 1}
+    record = logging.LogRecord("tests", logging.INFO, __file__, 1, "values %s", (values,), None)
+    prepared = handler.prepare(record)
+    values["a"] = 2
+    assert prepared.getMessage() == "values {'a': 1}"
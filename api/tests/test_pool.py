@@ -0,0 +1,41 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError, TimeoutError
+
+from config import settings
+from database.session import InstrumentedQueuePool, build_pool_options_from_settings
+
+
+def test_only_pool_timeouts_count_as_checkout_timeouts(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}", poolclass=InstrumentedQueuePool, pool_size=1, max_overflow=0, pool_timeout=0.05
+    )
+    with engine.connect():
+        with pytest.raises(TimeoutError):
+            engine.connect()
+    assert engine.pool.timeouts == 1
+    assert engine.pool.checkouts == 2
+
+    # Nothing listens there: a connect error, not a wait for the pool
+    unreachable = create_engine("postgresql://user:pw@127.0.0.1:1/db", poolclass=InstrumentedQueuePool)
+    with pytest.raises(OperationalError):
+        unreachable.connect()
+    assert unreachable.pool.timeouts == 0
+
+
+@pytest.mark.parametrize(
+    "env, workers, replicas, budget, expected",
+    [
+        ("prod", 4, 2, None, (5, 10)),
+        ("prod", 4, 2, 80, (5, 5)),
+        ("prod", 8, 2, 80, (5, 0)),
+        ("prod", 32, 2, 80, (1, 0)),
+        ("dev", 8, 2, 80, (5, 10)),
+    ],
+)
+def test_pools_share_the_connection_budget(env, workers, replicas, budget, expected):
+    options = build_pool_options_from_settings(settings.model_copy(update={
+        "ENV": env, "SERVER_WORKERS": workers, "API_REPLICAS": replicas, "DB_MAX_CONNECTIONS": budget,
+        "DB_POOL_SIZE": 5, "DB_MAX_OVERFLOW": 10,
+    }))
+    assert (options["pool_size"], options["max_overflow"]) == expected
@@ -0,0 +1,84 @@
+from cruds import async_user_crud
+from database.session import db_engine
+from services.cache import principal_cache, principal_version_key
+from tests.conftest import login, register
+
+
+def cached_entry(client, email):
+    return client.portal.call(principal_cache.get, email)
+
+
+def test_cached_principal_has_no_password_hash(client):
+    register(client, "a@example.com", "a")
+    headers = login(client, "a@example.com")
+
+    first = client.get("/user", headers=headers)
+    entry = cached_entry(client, "a@example.com")
+    assert entry is not None
+    assert "hashed_password" not in entry["user"]
+
+    # Served from the cache, the hash is read from the row
+    second = client.get("/user", headers=headers)
+    assert second.status_code == 200
+    assert second.json() == first.json()
+    assert second.json()["hashed_password"].startswith("$2b$")
+
+
+def test_update_is_visible_at_once(client):
+    register(client, "a@example.com", "a")
+    headers = login(client, "a@example.com")
+    client.get("/user", headers=headers)
+
+    assert client.patch("/user", headers=headers, json={"username": "renamed"}).status_code == 200
+    assert client.get("/user", headers=headers).json()["username"] == "renamed"
+
+
+def test_password_change_through_cached_principal(client):
+    register(client, "a@example.com", "a")
+    headers = login(client, "a@example.com")
+    client.get("/user", headers=headers)
+
+    assert client.patch("/user", headers=headers, json={"password": "new-pw"}).status_code == 200
+    # The old token is revoked, the new password works
+    assert client.get("/user", headers=headers).status_code == 401
+    assert client.get("/user", headers=login(client, "a@example.com", "new-pw")).status_code == 200
+
+
+def test_bulk_update_revokes_cached_principal(client):
+    register(client, "a@example.com", "a")
+    headers = login(client, "a@example.com")
+    user_id = client.get("/user", headers=headers).json()["id"]
+
+    async def bump_token_version():
+        db = db_engine.session()
+        try:
+            return await async_user_crud.bulk_update(db, [{"id": user_id, "token_version": 1}])
+        finally:
+            db.close()
+
+    assert client.portal.call(bump_token_version).count == 1
+    assert client.portal.call(principal_cache.get, principal_version_key(user_id)) == 1
+    response = client.get("/user", headers=headers)
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Token has been revoked"
+
+
+def test_entry_under_old_version_is_not_served(client):
+    register(client, "a@example.com", "a")
+    headers = login(client, "a@example.com")
+    user = client.get("/user", headers=headers).json()
+
+    stale = {**cached_entry(client, "a@example.com"), "version": -1}
+    stale["user"] = {**stale["user"], "username": "stale"}
+    client.portal.call(principal_cache.set, "a@example.com", stale, 60)
+
+    assert client.get("/user", headers=headers).json()["username"] == user["username"]
+
+
+def test_deleted_user_loses_access(client):
+    register(client, "a@example.com", "a")
+    headers = login(client, "a@example.com")
+    client.get("/user", headers=headers)
+
+    assert client.delete("/user", headers=headers).status_code == 200
+    assert client.get("/user", headers=headers).status_code == 401
@@ -0,0 +1,33 @@
+from profiling import _is_admin, _requested_mode
+from tests.conftest import login, register
+
+
+def scope_with(headers=None, query=b""):
+    return {
+        "type": "http",
+        "headers": [(key.lower().encode(), value.encode()) for key, value in (headers or {}).items()],
+        "query_string": query,
+    }
+
+
+def test_requested_mode():
+    assert _requested_mode(scope_with()) is None
+    assert _requested_mode(scope_with({"X-Profile": "store"})) == "store"
+    assert _requested_mode(scope_with({"X-Profile": "1"})) == "speedscope"
+    assert _requested_mode(scope_with(query=b"profile=store")) == "store"
+
+
+def test_only_current_admins_may_profile(client, admin_headers):
+    register(client, "user@example.com", "user")
+    user_headers = login(client, "user@example.com")
+
+    assert client.portal.call(_is_admin, scope_with(admin_headers)) is True
+    assert client.portal.call(_is_admin, scope_with(user_headers)) is False
+    assert client.portal.call(_is_admin, scope_with()) is False
+    assert client.portal.call(_is_admin, scope_with({"Authorization": "Bearer not-a-token"})) is False
+
+
+def test_revoked_admin_token_may_not_profile(client, admin_headers):
+    # A new password revokes the token, though its roles claim still says admin
+    assert client.patch("/user", headers=admin_headers, json={"password": "changed"}).status_code == 200
+    assert client.portal.call(_is_admin, scope_with(admin_headers)) is False